@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MyShelf.settings')
+# picks the ASGI defaults in settings.py (no persistent connections)
+os.environ.setdefault('SERVER_INTERFACE', 'asgi')
 
 application = get_asgi_application()
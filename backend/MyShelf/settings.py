@@ -1,5 +1,5 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -7,6 +7,24 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# uploaded files are stored once under their content hash, see
+# projectmanager/storage.py; uploads are streamed to disk and hashed
+# while they arrive (keep FILE_UPLOAD_TEMP_DIR on the MEDIA_ROOT
+# filesystem so they are moved into place, not copied)
+DEFAULT_FILE_STORAGE = 'projectmanager.storage.HashedMediaStorage'
+FILE_UPLOAD_HANDLERS = ['projectmanager.uploads.HashingUploadHandler']
+FILE_UPLOAD_TEMP_DIR = config("FILE_UPLOAD_TEMP_DIR", default=None)
+
+# how /media/ files are sent: "django", "x-sendfile" or "x-accel-redirect"
+# (see projectmanager/media.py)
+MEDIA_SERVE_MODE = config("MEDIA_SERVE_MODE", default="django")
+MEDIA_ACCEL_PREFIX = config("MEDIA_ACCEL_PREFIX", default="/protected-media/")
+
+# sizes (in px) of the renditions generated for uploaded thumbnails
+# and their format ("webp" or "jpeg")
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_FORMAT = config("THUMBNAIL_FORMAT", default="webp")
+
 CORS_ORIGIN_ALLOW_ALL = True
 
 DEBUG = False
@@ -15,9 +33,148 @@ ALLOWED_HOSTS = ["127.0.0.1", "0.0.0.0", "euresti-myshelf.herokuapp.com"]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication'
+        'projectmanager.authentication.CachedTokenAuthentication'
+    ],
+    # orjson when installed, see projectmanager/renderers.py
+    'DEFAULT_RENDERER_CLASSES': [
+        'projectmanager.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # per-client token buckets for the scopes of projectmanager/throttling.py:
+    # log in and sign up, writes, and the table-wide deletes
+    'DEFAULT_THROTTLE_CLASSES': [
+        'projectmanager.throttling.BucketThrottle',
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        'auth': config("THROTTLE_AUTH_RATE", default="20/minute"),
+        'write': config("THROTTLE_WRITE_RATE", default="120/minute"),
+        'admin': config("THROTTLE_ADMIN_RATE", default="6/minute"),
+    },
+    # proxies in front of the app that append to X-Forwarded-For (the
+    # Heroku router is one); anonymous clients are throttled by the
+    # address the last of them saw, the entries before it are whatever
+    # the client sent. 0 when clients connect directly.
+    'NUM_PROXIES': config("THROTTLE_NUM_PROXIES", default=1, cast=int),
+}
+
+# THROTTLE_ENABLED=False switches both the rate limits and the
+# concurrency limits off. THROTTLE_SHARED counts the rate limits in the
+# shared cache (needs CACHE_URL) so they hold across workers. Requests
+# of a scope running at once per process beyond THROTTLE_CONCURRENCY
+# get a 429 (0 for no limit).
+THROTTLE_ENABLED = config("THROTTLE_ENABLED", default=True, cast=bool)
+THROTTLE_SHARED = config("THROTTLE_SHARED", default=False, cast=bool)
+THROTTLE_MAX_CLIENTS = config("THROTTLE_MAX_CLIENTS", default=10000, cast=int)
+THROTTLE_CONCURRENCY = {
+    'auth': config("THROTTLE_AUTH_CONCURRENCY", default=8, cast=int),
+    'write': config("THROTTLE_WRITE_CONCURRENCY", default=16, cast=int),
+    'admin': config("THROTTLE_ADMIN_CONCURRENCY", default=1, cast=int),
+}
+
+# Per-process LRU cache by default. Set CACHE_URL to a redis:// URL
+# (requires the `redis` package) to share the cache between workers.
+CACHE_URL = config("CACHE_URL", default="")
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {
+                'MAX_ENTRIES': config("CACHE_MAX_ENTRIES", default=10000, cast=int),
+            },
+        }
+    }
+
+# resolved auth tokens, per process (see projectmanager/authentication.py)
+CACHES['tokens'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tokens',
+    'OPTIONS': {
+        'MAX_ENTRIES': config("TOKEN_CACHE_SIZE", default=1024, cast=int),
+    },
+}
+
+# seconds a resolved token is kept in the shared cache when CACHE_URL is
+# set, and in the per-process cache; a log out on another worker is
+# seen by this one after at most TOKEN_LOCAL_CACHE_TTL seconds, so keep
+# that short
+TOKEN_CACHE_TTL = config("TOKEN_CACHE_TTL", default=300, cast=int)
+TOKEN_LOCAL_CACHE_TTL = config("TOKEN_LOCAL_CACHE_TTL", default=5, cast=int)
+
+# seconds an auth token is valid after log_in/ (0 = forever); logging
+# in with an expired token hands out a new one
+TOKEN_TTL = config("TOKEN_TTL", default=0, cast=int)
+
+# seconds project and profile reads are kept in the cache
+READ_CACHE_TTL = config("READ_CACHE_TTL", default=300, cast=int)
+
+# seconds a verified username/password pair is remembered by the
+# body-authenticated write endpoints (0 disables the cache)
+CREDENTIAL_CACHE_TTL = config("CREDENTIAL_CACHE_TTL", default=300, cast=int)
+
+# password hashing for create_account/ and log_in/ (see
+# projectmanager/hashing.py): threads hashing in parallel, and requests
+# allowed to wait for them before the next one gets a 429
+HASHING_WORKERS = config("HASHING_WORKERS", default=2, cast=int)
+HASHING_QUEUE = config("HASHING_QUEUE", default=8, cast=int)
+
+# hasher for new passwords: "pbkdf2" (Django's default), "scrypt" or
+# "argon2" (requires argon2-cffi); existing hashes of the other kinds
+# still verify and are upgraded on the next log in
+PASSWORD_HASHER = config("PASSWORD_HASHER", default="pbkdf2")
+SCRYPT_WORK_FACTOR = config("SCRYPT_WORK_FACTOR", default=2 ** 14, cast=int)
+ARGON2_TIME_COST = config("ARGON2_TIME_COST", default=2, cast=int)
+ARGON2_MEMORY_COST = config("ARGON2_MEMORY_COST", default=102400, cast=int)
+ARGON2_PARALLELISM = config("ARGON2_PARALLELISM", default=8, cast=int)
+
+PASSWORD_HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'projectmanager.hashing.ScryptPasswordHasher',
+    'argon2': 'projectmanager.hashing.Argon2PasswordHasher',
 }
+PASSWORD_HASHERS = [PASSWORD_HASHERS.pop(PASSWORD_HASHER)] + list(PASSWORD_HASHERS.values()) + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# threads used for background work such as thumbnail cleanup
+BACKGROUND_WORKERS = config("BACKGROUND_WORKERS", default=2, cast=int)
+
+# largest number of operations accepted by one batch/ request, and
+# rows per INSERT/UPDATE statement when they are written
+BATCH_MAX_OPERATIONS = config("BATCH_MAX_OPERATIONS", default=5000, cast=int)
+BATCH_WRITE_SIZE = 500
+
+# the changes/ feed: seconds a change waits before it is served (so a
+# late committing transaction can't slip behind a client's cursor) and
+# days deletes are remembered
+CHANGES_SETTLE_SECONDS = config("CHANGES_SETTLE_SECONDS", default=5, cast=int)
+CHANGES_RETENTION_DAYS = config("CHANGES_RETENTION_DAYS", default=30, cast=int)
+
+# serve projects/, view_project/, get_thumbnail/ and profile/ with
+# native async views; meant for the ASGI deployment (uvicorn workers,
+# see the Procfile)
+ASYNC_READ_VIEWS = config("ASYNC_READ_VIEWS", default=False, cast=bool)
+
+# response compression (projectmanager.middleware.CompressionMiddleware):
+# brotli when the brotli package is installed and accepted, else gzip,
+# for bodies of at least COMPRESSION_MIN_SIZE bytes; with
+# COMPRESSION_CACHE_TTL > 0 compressed bodies of responses with an
+# ETag are cached for that many seconds
+COMPRESSION_MIN_SIZE = config("COMPRESSION_MIN_SIZE", default=1024, cast=int)
+COMPRESSION_GZIP_LEVEL = config("COMPRESSION_GZIP_LEVEL", default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config("COMPRESSION_BROTLI_QUALITY", default=5, cast=int)
+COMPRESSION_CACHE_TTL = config("COMPRESSION_CACHE_TTL", default=0, cast=int)
+
+# share of requests timed by MetricsMiddleware (0 to 1), see /metrics
+METRICS_SAMPLE_RATE = config("METRICS_SAMPLE_RATE", default=1.0, cast=float)
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -33,6 +190,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'projectmanager.middleware.MetricsMiddleware',
+    'projectmanager.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,17 +222,57 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'MyShelf.wsgi.application'
 
+# DB_CONN_MAX_AGE: seconds a connection is kept open and reused across
+#   requests (0 closes it after every request). Defaults to 0 for the
+#   ASGI deployment (SERVER_INTERFACE=asgi, also set by MyShelf.asgi),
+#   where every request may run on a different thread.
+# DB_CONN_HEALTH_CHECKS: check a reused connection before handing it
+#   to a request, so a dropped connection doesn't fail that request.
+# DB_PGBOUNCER: connect through pgbouncer in transaction pooling mode,
+#   which doesn't support server-side cursors (used by .iterator()).
+SERVER_INTERFACE = config("SERVER_INTERFACE", default="wsgi")
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'dkrc84mob5bdk',
-        'HOST': 'ec2-23-23-151-191.compute-1.amazonaws.com',
-        'PORT': 5432,
-        'USER': 'ikkpikgkmswgrj',
-        'PASSWORD': 'b7ce6056b932c8d79f7c57d235672b3a673f428f162c901c4bf0905bb698e09f'
+        'ENGINE': config("DB_ENGINE", default='django.db.backends.postgresql'),
+        'NAME': config("DB_NAME", default='dkrc84mob5bdk'),
+        'HOST': config("DB_HOST", default='ec2-23-23-151-191.compute-1.amazonaws.com'),
+        'PORT': config("DB_PORT", default=5432, cast=int),
+        'USER': config("DB_USER", default='ikkpikgkmswgrj'),
+        'PASSWORD': config("DB_PASSWORD", default='b7ce6056b932c8d79f7c57d235672b3a673f428f162c901c4bf0905bb698e09f'),
+        'CONN_MAX_AGE': config("DB_CONN_MAX_AGE", default=0 if SERVER_INTERFACE == 'asgi' else 600, cast=int),
+        'CONN_HEALTH_CHECKS': config("DB_CONN_HEALTH_CHECKS", default=True, cast=bool),
+        'DISABLE_SERVER_SIDE_CURSORS': config("DB_PGBOUNCER", default=False, cast=bool),
     }
 }
 
+# read replicas, e.g. DB_REPLICAS="replica1.example.com*2,replica2.example.com:6432"
+# (host[:port], optionally *weight); they share the primary's other
+# settings. For SQLite give database files instead of hosts. Reads of
+# GET/HEAD requests are spread over them (see projectmanager/routers.py),
+# a client that wrote is pinned to the primary for REPLICA_PIN_SECONDS.
+REPLICA_WEIGHTS = {}
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", default=10, cast=int)
+
+for number, replica in enumerate(config("DB_REPLICAS", default="", cast=Csv()), 1):
+    location, _, weight = replica.partition('*')
+    alias = 'replica%d' % number
+
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        overrides = {'NAME': location}
+    else:
+        host, _, port = location.partition(':')
+        overrides = {'HOST': host, 'PORT': int(port) if port else DATABASES['default']['PORT']}
+
+    # tests read the test database through the replica aliases
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'}, **overrides)
+    REPLICA_WEIGHTS[alias] = int(weight) if weight else 1
+
+if REPLICA_WEIGHTS:
+    DATABASE_ROUTERS = ['projectmanager.routers.ReplicaRouter']
+    MIDDLEWARE.insert(MIDDLEWARE.index('projectmanager.middleware.CompressionMiddleware') + 1,
+                      'projectmanager.middleware.ReplicaMiddleware')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
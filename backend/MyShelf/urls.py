@@ -1,14 +1,17 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework import routers
 from projectmanager import urls
 
 #
-from django.conf.urls.static import static
 from django.conf import settings
+from projectmanager.media import serve_media
+from projectmanager.metrics import metrics_view
 #
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('projectmanager/', include(urls)),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics', metrics_view),
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media),
+]
@@ -0,0 +1,63 @@
+# Concurrent load scenario for a running server, seeded with
+# `manage.py benchmark`'s data generator or real data:
+#
+#   pip install locust
+#   locust -f locustfile.py --host http://localhost:8000 --users 50 --spawn-rate 10
+#
+# BENCH_USERS users named user0..user<n-1> with BENCH_PASSWORD are
+# expected to exist (see projectmanager/benchmarks.py seed()).
+import itertools
+import os
+import random
+
+from locust import HttpUser, between, task
+
+USERS = int(os.environ.get('BENCH_USERS', 100))
+PASSWORD = os.environ.get('BENCH_PASSWORD', 'benchmark-password')
+PROJECTS = int(os.environ.get('BENCH_PROJECTS', 1000))
+
+_ids = itertools.count()
+
+
+class ShelfVisitor(HttpUser):
+    wait_time = between(0.1, 1)
+
+    def on_start(self):
+        self.username = 'user%d' % random.randrange(USERS)
+        response = self.client.post('/projectmanager/log_in/', json={'username': self.username, 'password': PASSWORD})
+        self.headers = {'Authorization': 'Token ' + response.json()['token']}
+
+    @task(10)
+    def projects(self):
+        self.client.get('/projectmanager/projects/')
+
+    @task(5)
+    def view_project(self):
+        self.client.get('/projectmanager/view_project/?title=project %d' % random.randrange(PROJECTS),
+                        name='/projectmanager/view_project/')
+
+    @task(5)
+    def get_thumbnail(self):
+        self.client.get('/projectmanager/get_thumbnail/?title=project %d' % random.randrange(PROJECTS),
+                        name='/projectmanager/get_thumbnail/')
+
+    @task(3)
+    def search(self):
+        self.client.get('/projectmanager/search/?q=garden', name='/projectmanager/search/')
+
+    @task(3)
+    def profile(self):
+        self.client.get('/projectmanager/profile/?username=user%d' % random.randrange(USERS),
+                        name='/projectmanager/profile/')
+
+    @task(2)
+    def users(self):
+        self.client.get('/projectmanager/users/')
+
+    @task(1)
+    def create_and_delete(self):
+        title = 'load %d-%d' % (os.getpid(), next(_ids))
+        self.client.post('/projectmanager/create/', headers=self.headers, json={
+            'title': title, 'long_description': 'long', 'short_description': 'short', 'contributions': 'all'})
+        self.client.post('/projectmanager/update/', headers=self.headers, json={'title': title, 'contributions': 'more'})
+        self.client.post('/projectmanager/delete_project/', headers=self.headers, json={'title': title})
@@ -1,6 +1,28 @@
+import django
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class ProjectmanagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'projectmanager'
+
+    def ready(self):
+        # connect the cache invalidation signal handlers
+        from . import signals
+
+        # full-text search table for local SQLite databases
+        from .search import install_sqlite_fts
+        post_migrate.connect(install_sqlite_fts, sender=self)
+
+        # health checks of persistent database connections
+        if django.VERSION < (4, 1):
+            from .db import check_connections, install_health_check
+            request_started.connect(check_connections)
+            connection_created.connect(install_health_check)
+
+        # query count and time for the metrics middleware
+        from .metrics import install_query_timer
+        connection_created.connect(install_query_timer)
@@ -0,0 +1,119 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from rest_framework import status
+
+from . import readcache
+from .conditional import add_validators, aggregate_validators, conditional_response, row_validators
+from .models import Project
+from .renderers import FastJSONRenderer
+from .serializers import ProjectSerializer
+from .thumbnails import best_rendition
+from .views import PROFILE_PARAMETERS, project_page, project_paginator, requested_fields
+
+# Native async versions of the read endpoints projects/, view_project/,
+# get_thumbnail/ and profile/, used instead of the ProjectViewSet and
+# UserViewSet actions when ASYNC_READ_VIEWS is on (see urls.py) and the
+# app is served through MyShelf.asgi. Requests and responses are the
+# same as the DRF versions.
+#
+# Django 4.0 has no async ORM yet (aget/async for came with 4.1), so
+# database and file access hop to a worker thread with sync_to_async;
+# while a request waits for it, or for a slow client, the event loop
+# keeps serving others.
+
+renderer = FastJSONRenderer()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(renderer.render(data), status=status_code,
+                        content_type=renderer.media_type)
+
+
+def bad_request(data):
+    return json_response(data, status.HTTP_400_BAD_REQUEST)
+
+
+async def projects(request):
+    # StreamingHttpResponse can't read from the database under ASGI
+    # before Django 4.2, the export stays on the WSGI deployment
+    if request.GET.get('stream') == 'ndjson':
+        return bad_request({"error":"stream=ndjson is not available on the async deployment"})
+
+    try:
+        fields = requested_fields(request, ProjectSerializer.Meta.fields)
+    except ValueError as e:
+        return bad_request({"error":str(e)})
+
+    validators = await sync_to_async(aggregate_validators)(Project.objects.all(), request.GET.urlencode())
+    not_modified = conditional_response(request, validators)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        data, next_cursor = await sync_to_async(project_page)(request, fields)
+    except ValueError as e:
+        return bad_request({"error":str(e)})
+
+    response = add_validators(json_response(data), validators)
+    return project_paginator.add_headers(response, request, next_cursor)
+
+
+async def view_project(request):
+    if len(request.GET) != 1:
+        return bad_request({"status":"incorrect number of arguments"})
+
+    try:
+        project = await sync_to_async(readcache.get_project)(request.GET['title'])
+    except (KeyError, Http404):
+        return bad_request({"status":"bad request"})
+
+    validators = row_validators(project['id'], project['updated_at'])
+    not_modified = conditional_response(request, validators)
+    if not_modified is not None:
+        return not_modified
+
+    display = {
+        "long_description": project['long_description'],
+        "contributions": project['contributions']
+    }
+    return add_validators(json_response(display), validators)
+
+
+async def get_thumbnail(request):
+    num_parameters = len(request.GET)
+    if 'size' in request.GET:
+        num_parameters -= 1
+
+    if num_parameters != 1:
+        return bad_request({"status":"incorrect number of arguments"})
+
+    try:
+        project = await sync_to_async(readcache.get_project)(request.GET['title'])
+        thumbnail = project['thumbnail'] or ''
+
+        if 'size' in request.GET and thumbnail:
+            size = int(request.GET['size'])
+            thumbnail = await sync_to_async(best_rendition)(thumbnail, size) or thumbnail
+    except (KeyError, ValueError, Http404):
+        return bad_request({"status":"bad request"})
+
+    return json_response({"thumbnail":"/media/" + thumbnail})
+
+
+async def profile(request):
+    if 'username' not in request.GET or not set(request.GET) <= PROFILE_PARAMETERS:
+        return bad_request({"status":"incorrect number of arguments"})
+
+    try:
+        display, next_cursor, validators = await sync_to_async(readcache.get_profile)(request.GET['username'], request)
+    except ValueError as e:
+        return bad_request({"error":str(e)})
+    except Http404:
+        return bad_request({"status":"bad request"})
+
+    not_modified = conditional_response(request, validators)
+    if not_modified is not None:
+        return not_modified
+
+    response = add_validators(json_response(display), validators)
+    return readcache.profile_paginator.add_headers(response, request, next_cursor)
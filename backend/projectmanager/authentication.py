@@ -0,0 +1,160 @@
+import copy
+import hashlib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .routers import from_primary
+
+# TokenAuthentication looks the token and its user up in the database
+# on every authenticated request. CachedTokenAuthentication keeps what
+# it resolved in a bounded per-process LRU (the "tokens" cache) and,
+# when CACHE_URL is set, in the shared cache too: the token as
+# (user_id, created) and, apart from it, the user with the Person row
+# but without the password hash. Entries are dropped when the token is
+# deleted (log_out/) or the user or Person row changes, see signals.py,
+# and never outlive the token itself (TOKEN_TTL). Bulk deletes that
+# send no signals (flush_database/) drop them all with forget_all().
+#
+# Shared entries carry the generation they were stored under and only
+# count while it is the current one, so forget_all() is one write.
+
+_MISSING = object()
+GENERATION_KEY = 'token-generation'
+
+
+def _local():
+    return caches['tokens']
+
+
+def _shared():
+    return caches['default'] if settings.CACHE_URL else None
+
+
+# raw tokens never reach the cache
+def token_key(key):
+    return 'token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def user_key(user_id):
+    return 'token-user:%s' % user_id
+
+
+def expires_at(token):
+    if not settings.TOKEN_TTL:
+        return None
+    return token.created + timedelta(seconds=settings.TOKEN_TTL)
+
+
+def is_expired(token):
+    expiry = expires_at(token)
+    return expiry is not None and expiry <= timezone.now()
+
+
+def _timeout(token, ttl):
+    expiry = expires_at(token)
+    if expiry is None:
+        return ttl
+    return max(0, min(ttl, int((expiry - timezone.now()).total_seconds())))
+
+
+def _get(key):
+    value = _local().get(key, _MISSING)
+    if value is _MISSING and _shared() is not None:
+        found = _shared().get_many([key, GENERATION_KEY])
+        if key in found and found[key][0] == found.get(GENERATION_KEY):
+            value = found[key][1]
+            _local().set(key, value, settings.TOKEN_LOCAL_CACHE_TTL)
+    return value
+
+
+def _set(key, value, token):
+    _local().set(key, value, _timeout(token, settings.TOKEN_LOCAL_CACHE_TTL))
+    if _shared() is not None:
+        generation = _shared().get(GENERATION_KEY)
+        _shared().set(key, (generation, value), _timeout(token, settings.TOKEN_CACHE_TTL))
+
+
+# a copy of the user without the password hash (it becomes a deferred
+# field: reading it, or saving the copy, goes to the database)
+def _without_password(user):
+    user = copy.copy(user)
+    user.__dict__.pop('password', None)
+    return user
+
+
+def remember_token(token):
+    _set(token_key(token.key), (token.user_id, token.created), token)
+    if Token.user.is_cached(token):
+        _set(user_key(token.user_id), _without_password(token.user), token)
+
+
+def forget_tokens(*keys):
+    keys = [token_key(key) for key in keys]
+    _local().delete_many(keys)
+    if _shared() is not None:
+        _shared().delete_many(keys)
+
+
+# token entries only hold (user_id, created), the user's own entry is
+# all that goes stale when the user or the Person row changes
+def forget_user(user_id):
+    _local().delete(user_key(user_id))
+    if _shared() is not None:
+        _shared().delete(user_key(user_id))
+
+
+# drops every entry; other workers' per-process entries expire within
+# TOKEN_LOCAL_CACHE_TTL
+def forget_all():
+    _local().clear()
+    if _shared() is not None:
+        _shared().set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+# both fill the caches, so they read from the primary (see routers.py)
+def load_token(key):
+    with from_primary():
+        return Token.objects.select_related('user', 'user__person').defer('user__password').filter(key=key).first()
+
+
+def load_user(user_id):
+    with from_primary():
+        return User.objects.select_related('person').defer('password').filter(pk=user_id).first()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cached = _get(token_key(key))
+
+        if cached is _MISSING:
+            token = load_token(key)
+            if token is None:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            remember_token(token)
+            user = token.user
+        else:
+            user_id, created = cached
+            token = Token(key=key, user_id=user_id, created=created)
+            user = _get(user_key(user_id))
+            if user is _MISSING:
+                user = load_user(user_id)
+                if user is not None:
+                    _set(user_key(user_id), user, token)
+
+        if is_expired(token):
+            raise exceptions.AuthenticationFailed('Token has expired.')
+
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        token.user = user
+        return (user, token)
@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+
+from .changes import delete_projects
+from .models import Project, update_search_vectors
+from .readcache import forget_projects
+from .serializers import ProjectSerializer
+
+# Batch create/update/delete of projects (see ProjectViewSet.batch).
+# Every operation is validated first, then all writes happen in one
+# transaction with bulk_create/bulk_update and a single DELETE. The
+# result list has one entry per operation, in order, with the status
+# code the single-item endpoint would have answered.
+
+OPERATIONS = ('create', 'update', 'delete')
+REQUIRED_FIELDS = ('title', 'contributions', 'long_description', 'short_description')
+UPDATABLE_FIELDS = ('contributions', 'long_description', 'short_description')
+
+
+def fail(result, code, error):
+    result['status'] = code
+    result['error'] = error
+
+
+def run_batch(user, operations):
+    # the child serializers validate one operation at a time so one
+    # bad item doesn't reject the whole batch
+    creates = ProjectSerializer(many=True)
+    updates = ProjectSerializer(many=True, partial=True)
+
+    results = []
+    pending = []
+    seen = set()
+
+    for index, operation in enumerate(operations):
+        result = {"index": index}
+        results.append(result)
+
+        if not isinstance(operation, dict):
+            fail(result, status.HTTP_400_BAD_REQUEST, "operation must be an object")
+            continue
+
+        op = result['op'] = operation.get('op')
+        title = result['title'] = operation.get('title')
+
+        if op not in OPERATIONS:
+            fail(result, status.HTTP_400_BAD_REQUEST, "op must be one of: " + ", ".join(OPERATIONS))
+            continue
+        if not title:
+            fail(result, status.HTTP_400_BAD_REQUEST, "title is required")
+            continue
+        if title in seen:
+            fail(result, status.HTTP_409_CONFLICT, "title appears more than once in this batch")
+            continue
+        seen.add(title)
+
+        if op == 'delete':
+            pending.append((result, op, {'title': title}))
+            continue
+
+        serializer = creates if op == 'create' else updates
+        try:
+            data = serializer.child.run_validation(operation)
+        except serializers.ValidationError as exc:
+            fail(result, status.HTTP_400_BAD_REQUEST, exc.detail)
+            continue
+
+        if op == 'create' and not all(data.get(field) for field in REQUIRED_FIELDS):
+            fail(result, status.HTTP_400_BAD_REQUEST, "required field(s) missing")
+            continue
+
+        pending.append((result, op, data))
+
+    # one query resolves every title the batch refers to
+    titles = [data['title'] for _, _, data in pending]
+    existing = {
+        project.title: project
+        for project in Project.objects.filter(title__in=titles)
+                                      .only('id', 'user_id', 'title', *UPDATABLE_FIELDS)
+    }
+
+    to_create, to_update, to_delete = [], [], []
+    now = timezone.now()
+
+    for result, op, data in pending:
+        project = existing.get(data['title'])
+
+        if op == 'create':
+            if project is not None:
+                fail(result, status.HTTP_409_CONFLICT, "project with that title already exists")
+                continue
+            project = Project(user=user, thumbnail='placeholder',
+                              **{field: data[field] for field in REQUIRED_FIELDS})
+            to_create.append(project)
+            result['status'] = status.HTTP_201_CREATED
+
+        elif project is None:
+            fail(result, status.HTTP_404_NOT_FOUND, "project not found")
+
+        elif project.user_id != user.pk:
+            fail(result, status.HTTP_401_UNAUTHORIZED, "you don't have permission")
+
+        elif op == 'update':
+            for field in UPDATABLE_FIELDS:
+                if data.get(field):
+                    setattr(project, field, data[field])
+            # bulk_update doesn't apply auto_now
+            project.updated_at = now
+            to_update.append(project)
+            result['status'] = status.HTTP_202_ACCEPTED
+
+        else:
+            to_delete.append(project)
+            result['status'] = status.HTTP_200_OK
+
+    # an IntegrityError here (a concurrent create took a title) rolls
+    # back the whole batch and is left to the caller
+    batch_size = settings.BATCH_WRITE_SIZE
+    with transaction.atomic():
+        Project.objects.bulk_create(to_create, batch_size=batch_size)
+        Project.objects.bulk_update(to_update, UPDATABLE_FIELDS + ('updated_at',), batch_size=batch_size)
+        if to_delete:
+            delete_projects(Project.objects.filter(pk__in=[project.pk for project in to_delete]))
+
+    # bulk writes bypass save() and send no signals
+    written = to_create + to_update
+    if written:
+        update_search_vectors(Project.objects.filter(title__in=[project.title for project in written]))
+        forget_projects(written)
+
+    return results
@@ -0,0 +1,438 @@
+import io
+import json
+import os
+import random
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from .middleware import brotli, compress
+from .models import Person, Project, update_search_vectors
+from .renderers import FastJSONRenderer
+from .projectors import project_projector
+from .search import search_projects
+from .serializers import ProjectSerializer
+
+# Benchmark suite for every route of projectmanager/urls.py, run with
+# `manage.py benchmark` (see management/commands/benchmark.py).
+
+PASSWORD = 'benchmark-password'
+ADMIN = 'benchmark-admin'
+
+WORDS = ('garden', 'robot', 'music', 'shelf', 'recipe', 'weather', 'chess', 'map', 'budget',
+         'photo', 'travel', 'fitness', 'reader', 'tracker', 'planner', 'game', 'chat', 'clock')
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def thumbnail_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (120, 160, 200)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+# Fills the database with `users` users (each with a Person row) owning
+# `projects_per_user` projects each, plus one superuser. Deterministic
+# for a given seed.
+def seed(users, projects_per_user, seed=0, batch_size=1000):
+    rng = random.Random(seed)
+    # hashing once keeps seeding fast; every user gets the same password
+    password = make_password(PASSWORD)
+
+    User.objects.create_superuser(ADMIN, 'admin@example.com', PASSWORD)
+    thumbnail = default_storage.save('images/benchmark.png', ContentFile(thumbnail_image()))
+
+    User.objects.bulk_create([
+        User(username='user%d' % i, first_name='User %d' % i, email='user%d@example.com' % i, password=password)
+        for i in range(users)
+    ], batch_size=batch_size)
+    user_ids = list(User.objects.filter(is_superuser=False).order_by('id').values_list('id', flat=True))
+
+    Person.objects.bulk_create([
+        Person(user_id=user_id, job_title=sentence(rng, 2)) for user_id in user_ids
+    ], batch_size=batch_size)
+
+    projects = []
+    for user_id in user_ids:
+        for _ in range(projects_per_user):
+            projects.append(Project(
+                user_id=user_id,
+                title='project %d' % len(projects),
+                short_description=sentence(rng, 12),
+                long_description=sentence(rng, 300),
+                contributions=sentence(rng, 80),
+                thumbnail=thumbnail,
+            ))
+            if len(projects) % batch_size == 0:
+                Project.objects.bulk_create(projects[-batch_size:])
+    Project.objects.bulk_create(projects[len(projects) - len(projects) % batch_size:])
+
+    update_search_vectors(Project.objects.all())
+    return thumbnail
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+# A scenario is one route driven `iterations` times. `request` gets
+# the iteration number and returns (method, path, data, extra); it runs
+# outside the timed section, so any setup it does isn't measured.
+class Scenario:
+
+    def __init__(self, name, request, destructive=False):
+        self.name = name
+        self.request = request
+        self.destructive = destructive
+
+    def run(self, client, iterations):
+        timings = []
+        queries = []
+
+        for i in range(iterations):
+            method, path, data, extra = self.request(i)
+            send = getattr(client, method)
+            if data is not None and method != 'get':
+                extra = dict(extra, content_type='application/json')
+                data = json.dumps(data)
+
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = send(path, data, **extra) if data is not None else send(path, **extra)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append(time.perf_counter() - started)
+
+            queries.append(len(captured.captured_queries))
+            if response.status_code >= 400:
+                raise RuntimeError('%s answered %d: %r' % (path, response.status_code, response.content[:200]))
+
+        return {
+            'iterations': iterations,
+            'p50_ms': percentile(timings, 0.50) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+            'queries': sum(queries) / len(queries),
+        }
+
+
+def scenarios(users, thumbnail):
+    credentials = {'username': 'user0', 'password': PASSWORD}
+    admin = {'username': ADMIN, 'password': PASSWORD}
+    project_fields = {'long_description': 'long', 'short_description': 'short', 'contributions': 'all of it'}
+    token_header = lambda: {'HTTP_AUTHORIZATION': 'Token ' + Token.objects.create(user=User.objects.get(username='user%d' % (users - 1))).key}
+
+    def deletable(i):
+        title = 'bench delete %d' % i
+        Project.objects.create(user=User.objects.get(username='user0'), title=title, **project_fields)
+        return ('post', '/projectmanager/delete_project/', dict(credentials, title=title), {})
+
+    return [
+        Scenario('projects', lambda i: ('get', '/projectmanager/projects/', None, {})),
+        Scenario('projects_fields', lambda i: ('get', '/projectmanager/projects/?fields=id,title,short_description&limit=200', None, {})),
+        Scenario('projects_stream', lambda i: ('get', '/projectmanager/projects/?stream=ndjson&fields=id,title', None, {})),
+        Scenario('search', lambda i: ('get', '/projectmanager/search/?q=garden robot', None, {})),
+        Scenario('changes', lambda i: ('get', '/projectmanager/changes/?fields=id,title', None, {})),
+        Scenario('view_project', lambda i: ('get', '/projectmanager/view_project/?title=project %d' % i, None, {})),
+        Scenario('get_thumbnail', lambda i: ('get', '/projectmanager/get_thumbnail/?title=project %d' % i, None, {})),
+        Scenario('users', lambda i: ('get', '/projectmanager/users/', None, {})),
+        Scenario('profile', lambda i: ('get', '/projectmanager/profile/?username=user%d' % (i % users), None, {})),
+        Scenario('cache_stats', lambda i: ('get', '/projectmanager/cache_stats/', None, {})),
+        Scenario('metrics', lambda i: ('get', '/metrics', None, {})),
+        Scenario('media', lambda i: ('get', settings.MEDIA_URL + thumbnail, None, {})),
+        Scenario('log_in', lambda i: ('post', '/projectmanager/log_in/', credentials, {})),
+        Scenario('log_out', lambda i: ('delete', '/projectmanager/log_out/', None, token_header())),
+        Scenario('create_account', lambda i: ('post', '/projectmanager/create_account/', {
+            'first_name': 'New', 'job_title': 'tester', 'username': 'new%d' % i,
+            'email': 'new%d@example.com' % i, 'password': PASSWORD}, {})),
+        Scenario('create', lambda i: ('post', '/projectmanager/create/', dict(credentials, title='bench create %d' % i, **project_fields), {})),
+        Scenario('update', lambda i: ('post', '/projectmanager/update/', dict(credentials, title='project 0', contributions='rev %d' % i), {})),
+        Scenario('delete_project', deletable),
+        Scenario('batch', lambda i: ('post', '/projectmanager/batch/', dict(credentials, operations=[
+            dict(op='create', title='bench batch %d-%d' % (i, n), **project_fields) for n in range(50)]), {})),
+        Scenario('delete_all_projects', lambda i: ('delete', '/projectmanager/delete_all_projects/', admin, {}), destructive=True),
+        Scenario('flush_database', lambda i: ('delete', '/projectmanager/flush_database/', admin, {}), destructive=True),
+    ]
+
+
+# runs the scenarios on a freshly seeded database; `seeded` (if given)
+# is called while the seeded data set is still there, right before the
+# destructive scenarios wipe it
+def run(users, projects_per_user, iterations, only=None, seeded=None):
+    thumbnail = seed(users, projects_per_user)
+    client = Client()
+    results = {}
+
+    for scenario in scenarios(users, thumbnail):
+        if only and scenario.name not in only:
+            continue
+        if scenario.destructive and seeded is not None:
+            seeded()
+            seeded = None
+        # destructive scenarios wipe the data set, once is all they get
+        results[scenario.name] = scenario.run(client, 1 if scenario.destructive else iterations)
+
+    if seeded is not None:
+        seeded()
+    return results
+
+
+# `signups` create_account/ requests sent by `concurrency` threads at
+# once; reports signups per second and how many were turned away (429)
+# by the hashing pool
+def signup_throughput(signups, concurrency):
+
+    def sign_up(i):
+        try:
+            return Client().post('/projectmanager/create_account/', {
+                'first_name': 'Burst', 'job_title': 'tester', 'username': 'burst%d' % i,
+                'email': 'burst%d@example.com' % i, 'password': PASSWORD}).status_code
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        statuses = Counter(pool.map(sign_up, range(signups)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'signups': signups,
+        'concurrency': concurrency,
+        'created_per_second': statuses[200] / elapsed,
+        'statuses': dict(statuses),
+    }
+
+
+# latency of a project lookup by title (the unique index) once the
+# table has grown to each of `sizes` rows, e.g. 10k, 100k and 1M;
+# looked up titles are spread over the whole table
+def title_lookups(sizes, lookups=500, batch_size=5000):
+    rng = random.Random(0)
+    inserted = 0
+    results = {}
+
+    for size in sorted(sizes):
+        while inserted < size:
+            count = min(batch_size, size - inserted)
+            Project.objects.bulk_create([Project(title='lookup %d' % i)
+                                         for i in range(inserted, inserted + count)])
+            inserted += count
+
+        samples = []
+        for _ in range(lookups):
+            title = 'lookup %d' % rng.randrange(size)
+            started = time.perf_counter()
+            Project.objects.filter(title=title).first()
+            samples.append((time.perf_counter() - started) * 1000)
+
+        results[size] = {'p50_ms': percentile(samples, 0.5), 'p99_ms': percentile(samples, 0.99)}
+
+    return results
+
+
+# latency of a two-word search/ query (search_projects, first page of
+# 20) once the table has grown to each of `sizes` rows; the target is
+# under 50 ms at 1M projects on Postgres. Descriptions draw from
+# `vocabulary` words: with a handful of words every query matches a
+# large share of the table and the time goes to ranking the matches.
+def search_lookups(sizes, searches=200, batch_size=5000, vocabulary=10000):
+    rng = random.Random(0)
+    words = ['%s%d' % (WORDS[i % len(WORDS)], i // len(WORDS)) for i in range(vocabulary)]
+
+    def text(count):
+        return ' '.join(rng.choice(words) for _ in range(count))
+
+    inserted = 0
+    results = {}
+
+    for size in sorted(sizes):
+        while inserted < size:
+            count = min(batch_size, size - inserted)
+            batch = Project.objects.bulk_create([
+                Project(title='search %d %s' % (i, text(2)),
+                        short_description=text(8), long_description=text(30))
+                for i in range(inserted, inserted + count)])
+            update_search_vectors(Project.objects.filter(pk__in=[project.pk for project in batch]))
+            inserted += count
+
+        samples = []
+        for _ in range(searches):
+            query = text(2)
+            started = time.perf_counter()
+            search_projects(query, 0, 20)
+            samples.append((time.perf_counter() - started) * 1000)
+
+        results[size] = {'p50_ms': percentile(samples, 0.5), 'p99_ms': percentile(samples, 0.99)}
+
+    return results
+
+
+# body-authenticated update/ requests per second, each verifying the
+# password (CREDENTIAL_CACHE_TTL=0, as before the credential cache) and
+# with verified credentials remembered; uses its own user and project
+def write_throughput(writes):
+    user = User.objects.create_user('benchmark-writer', password=PASSWORD)
+    Person.objects.create(user=user)
+    Project.objects.create(user=user, title='benchmark writes')
+    client = Client()
+    results = {'writes': writes}
+
+    for name, ttl in (('uncached', 0), ('cached', settings.CREDENTIAL_CACHE_TTL or 300)):
+        cache.clear()
+        with override_settings(CREDENTIAL_CACHE_TTL=ttl):
+            started = time.perf_counter()
+            for i in range(writes):
+                response = client.post('/projectmanager/update/', {
+                    'username': 'benchmark-writer', 'password': PASSWORD,
+                    'title': 'benchmark writes', 'contributions': '%s %d' % (name, i)})
+                if response.status_code != 202:
+                    raise RuntimeError('update/ answered %d' % response.status_code)
+            results[name + '_per_second'] = writes / (time.perf_counter() - started)
+
+    return results
+
+
+# projects created per second through one create/ request each
+# against batch/ requests of up to BATCH_MAX_OPERATIONS creates;
+# token-authenticated, uses its own user
+def batch_throughput(operations):
+    user = User.objects.create_user('benchmark-batcher', password=PASSWORD)
+    Person.objects.create(user=user)
+    client = Client(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+    fields = {'long_description': 'l', 'short_description': 's', 'contributions': 'c'}
+    results = {'operations': operations}
+
+    started = time.perf_counter()
+    for i in range(operations):
+        response = client.post('/projectmanager/create/', dict(title='single %d' % i, **fields))
+        if response.status_code != 201:
+            raise RuntimeError('create/ answered %d' % response.status_code)
+    results['single_per_second'] = operations / (time.perf_counter() - started)
+
+    creates = [dict(op='create', title='batched %d' % i, **fields) for i in range(operations)]
+    started = time.perf_counter()
+    for start in range(0, operations, settings.BATCH_MAX_OPERATIONS):
+        response = client.post('/projectmanager/batch/', creates[start:start + settings.BATCH_MAX_OPERATIONS],
+                               content_type='application/json')
+        if response.status_code != 200 or any(result['status'] != 201 for result in response.json()['results']):
+            raise RuntimeError('batch/ answered %d' % response.status_code)
+    results['batch_per_second'] = operations / (time.perf_counter() - started)
+
+    return results
+
+
+def noise_image(seed, size=512):
+    # random pixels don't compress, the PNG stays about size*size*3 bytes
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', (size, size), random.Random(seed).randbytes(size * size * 3)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def disk_usage(directory):
+    total = 0
+    for root, _, files in os.walk(os.path.join(settings.MEDIA_ROOT, directory)):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+# `uploads` create/ requests with a thumbnail as user0 of the seeded
+# data set, cycling through `distinct` different images; reports the
+# peak Python memory while uploading and what ends up on disk under
+# images/
+def upload_usage(uploads, distinct):
+    images = [noise_image(i) for i in range(distinct)]
+    stored_before = disk_usage('images')
+    client = Client()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        for i in range(uploads):
+            upload = SimpleUploadedFile('upload %d.png' % i, images[i % distinct], content_type='image/png')
+            response = client.post('/projectmanager/create/', {
+                'username': 'user0', 'password': PASSWORD, 'title': 'bench upload %d' % i, 'thumbnail': upload,
+                'long_description': 'long', 'short_description': 'short', 'contributions': 'all of it'})
+            if response.status_code != 201:
+                raise RuntimeError('create/ answered %d: %r' % (response.status_code, response.content[:200]))
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'uploads': uploads,
+        'distinct': distinct,
+        'ms_per_upload': elapsed * 1000 / uploads,
+        'peak_memory': peak,
+        'uploaded_bytes': sum(len(images[i % distinct]) for i in range(uploads)),
+        'stored_bytes': disk_usage('images') - stored_before,
+    }
+
+
+def timed_call(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+# serialization time and bytes on the wire of a listing of every seeded
+# project (10k with --users 1000 --projects 10): ProjectSerializer
+# against the row projector (query included for both), DRF's renderer
+# against FastJSONRenderer, then gzip and brotli
+def payload():
+    projects = Project.objects.order_by('pk')
+    if not projects.exists():
+        raise RuntimeError('payload found no projects to measure')
+    data, serialize_ms = timed_call(lambda: ProjectSerializer(projects, many=True).data)
+    rows, _ = project_projector.values(projects)
+    projected, project_ms = timed_call(lambda: project_projector.project_all(rows))
+    content, drf_ms = timed_call(JSONRenderer().render, data)
+    fast_content, fast_ms = timed_call(FastJSONRenderer().render, data)
+
+    results = {
+        'projects': len(data),
+        'serializer_ms': serialize_ms,
+        'projector_ms': project_ms,
+        'projector_identical': JSONRenderer().render(projected) == content,
+        'render_ms': {'drf': drf_ms, 'fast': fast_ms},
+        'bytes': {'identity': len(content)},
+        'compress_ms': {},
+    }
+    for coding in ('gzip', 'br') if brotli is not None else ('gzip',):
+        compressed, compress_ms = timed_call(compress, coding, fast_content)
+        results['bytes'][coding] = len(compressed)
+        results['compress_ms'][coding] = compress_ms
+
+    return results
+
+
+# compares `results` with a stored baseline; returns the names of the
+# scenarios whose p50 got more than `tolerance` slower or that now
+# need more queries
+def regressions(results, baseline, tolerance):
+    regressed = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries'] or result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressed.append(name)
+    return regressed
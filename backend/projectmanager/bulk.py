@@ -0,0 +1,21 @@
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+from .models import Person
+
+
+# Set-based delete of users for flush_database/. QuerySet.delete()
+# would load every user, Person row and token to send post_delete for
+# each one (running the receivers in signals.py row by row); here each
+# table goes with one DELETE ... WHERE user_id IN (SELECT ...), the rows
+# pointing to the users first. The users' projects must be deleted
+# already (changes.delete_projects). Call it inside a transaction and
+# drop the caches once it commits (authentication.forget_all(),
+# readcache.forget_all()). Returns (users, persons) deleted.
+def delete_users(users):
+    ids = users.order_by().values('pk')
+    for model in (Token, LogEntry, User.groups.through, User.user_permissions.through):
+        model.objects.filter(user__in=ids)._raw_delete(users.db)
+    persons = Person.objects.filter(user__in=ids)._raw_delete(users.db)
+    return users.order_by()._raw_delete(users.db), persons
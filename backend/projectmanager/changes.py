@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import readcache
+from .models import Project, ProjectTombstone
+from .pagination import decode_cursor, encode_cursor
+from .tasks import release_thumbnails, submit
+
+# Change feed behind changes/. Updates come from Project.updated_at,
+# deletes from the tombstones written by delete_projects(). Both are
+# merged in (timestamp, kind, id) order, which is also what the cursor
+# holds, so a client syncs in O(changes) instead of downloading
+# projects/ again.
+#
+# Changes younger than CHANGES_SETTLE_SECONDS aren't served yet: a
+# transaction may commit after a later one and would otherwise end up
+# behind a cursor a client already has.
+
+UPDATED = 0
+DELETED = 1
+
+
+class CursorExpired(Exception):
+    pass
+
+
+# deletes the projects and leaves a tombstone for each one, dropping
+# the tombstones past CHANGES_RETENTION_DAYS on the way; call it inside
+# a transaction. Once it commits, the thumbnails no other project uses
+# are deleted in the background. Returns the number of projects deleted.
+#
+# Everything stays in the database: the tombstones are written with one
+# INSERT ... SELECT, the rows go with one DELETE that sends no signals
+# (QuerySet.delete() would load every project to send post_delete for
+# it). The read cache is told here instead: entry by entry for a few
+# projects, all at once (readcache.forget_all()) with `everything`.
+def delete_projects(projects, everything=False):
+    prune_tombstones()
+    projects = projects.using(router.db_for_write(Project)).order_by()
+    write_tombstones(projects, timezone.now())
+
+    thumbnails = list(projects.exclude(thumbnail=None).exclude(thumbnail='')
+                      .values_list('thumbnail', flat=True).distinct())
+    if everything:
+        forget = readcache.forget_all
+    else:
+        deleted = [Project(title=title, user_id=user_id) for title, user_id in projects.values_list('title', 'user_id')]
+        forget = lambda: readcache.forget_projects(deleted)
+
+    count = projects._raw_delete(projects.db)
+    transaction.on_commit(forget)
+    transaction.on_commit(lambda: submit(release_thumbnails, thumbnails))
+    return count
+
+
+def write_tombstones(projects, deleted_at):
+    connection = connections[projects.db]
+    select, params = projects.values_list('pk', 'title').query.sql_with_params()
+    deleted_at = ProjectTombstone._meta.get_field('deleted_at').get_db_prep_value(deleted_at, connection)
+
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO %s (project_id, title, deleted_at) SELECT p.id, p.title, %%s FROM (%s) p' % (
+            connection.ops.quote_name(ProjectTombstone._meta.db_table), select), (deleted_at, *params))
+
+
+def prune_tombstones():
+    cutoff = timezone.now() - timedelta(days=settings.CHANGES_RETENTION_DAYS)
+    ProjectTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+
+
+def _after(queryset, field, kind, position):
+    timestamp, after_kind, after_id = position
+    later = Q(**{field + '__gt': timestamp})
+    if kind > after_kind:
+        later |= Q(**{field: timestamp})
+    elif kind == after_kind:
+        later |= Q(**{field: timestamp, 'pk__gt': after_id})
+    return queryset.filter(later)
+
+
+def _position(cursor):
+    values = decode_cursor(cursor)
+    timestamp = parse_datetime(values[0]) if len(values) == 3 and isinstance(values[0], str) else None
+    if timestamp is None or values[1] not in (UPDATED, DELETED) or not isinstance(values[2], int):
+        raise ValueError("invalid cursor")
+
+    if timestamp < timezone.now() - timedelta(days=settings.CHANGES_RETENTION_DAYS):
+        raise CursorExpired
+    return timestamp, values[1], values[2]
+
+
+# returns (changes, next_cursor, more): at most `limit` (kind, object)
+# pairs after `cursor` (everything when None), the cursor to resume
+# from and whether more changes are waiting
+def get_changes(projects, cursor, limit):
+    settled = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    projects = projects.filter(updated_at__lte=settled)
+    tombstones = ProjectTombstone.objects.filter(deleted_at__lte=settled)
+
+    if cursor:
+        position = _position(cursor)
+        projects = _after(projects, 'updated_at', UPDATED, position)
+        tombstones = _after(tombstones, 'deleted_at', DELETED, position)
+
+    changes = sorted(
+        [(project.updated_at, UPDATED, project.pk, project)
+         for project in projects.order_by('updated_at', 'id')[:limit + 1]] +
+        [(tombstone.deleted_at, DELETED, tombstone.pk, tombstone)
+         for tombstone in tombstones.order_by('deleted_at', 'id')[:limit + 1]],
+        key=lambda change: change[:3])
+
+    more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        cursor = encode_cursor(changes[-1][:3])
+
+    return [(kind, change) for _, kind, _, change in changes], cursor, more
@@ -0,0 +1,66 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# HTTP conditional requests (ETag / Last-Modified / 304 Not Modified).
+# Validators are computed from updated_at timestamps, never by
+# rendering and hashing the response body, so a 304 costs no
+# serialization at all.
+
+
+def _microseconds(timestamp):
+    return int(timestamp.timestamp() * 1000000) if timestamp else 0
+
+
+def row_validators(pk, updated_at):
+    etag = '"%s-%x"' % (pk, _microseconds(updated_at))
+    last_modified = int(updated_at.timestamp()) if updated_at else None
+    return etag, last_modified
+
+
+# validators for a listing: the newest updated_at plus the row count
+# (so deletes change it too), made unique per query string since
+# cursor, limit and fields change the representation. Listings get no
+# Last-Modified: deleting a row other than the newest leaves the newest
+# updated_at as it was, and a client revalidating with If-Modified-Since
+# alone would be told its copy is current.
+def aggregate_validators(queryset, variant=''):
+    result = queryset.aggregate(last=Max('updated_at'), count=Count('pk'))
+    variant = hashlib.sha1(variant.encode()).hexdigest()[:12]
+
+    etag = '"%d-%x-%s"' % (result['count'], _microseconds(result['last']), variant)
+    return etag, None
+
+
+# validators for a page from the (id, updated_at) pairs of its rows,
+# which were loaded anyway: the page changes when any of its rows does
+# or when the next page appears or goes away. ETag only, like listings.
+def page_validators(versions, next_cursor):
+    digest = hashlib.sha1(repr(next_cursor).encode())
+    for pk, updated_at in versions:
+        digest.update(b'%d-%x;' % (pk, _microseconds(updated_at)))
+
+    etag = '"%d-%s"' % (len(versions), digest.hexdigest()[:16])
+    return etag, None
+
+
+def add_validators(response, validators):
+    etag, last_modified = validators
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # clients may keep the response but have to revalidate it
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+# returns a 304 (or 412) response if the request's preconditions say
+# the client's copy is still current, None otherwise
+def conditional_response(request, validators):
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        add_validators(response, validators)
+    return response
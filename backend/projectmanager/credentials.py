@@ -0,0 +1,83 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+
+from .metrics import timed
+from .models import Person
+
+# Verifying a password runs the full PBKDF2 hash, which is by far the
+# most expensive part of a write request. Once a username/password pair
+# has been verified we remember it for CREDENTIAL_CACHE_TTL seconds.
+#
+# The cache key is an HMAC of the credentials (salted with SECRET_KEY),
+# so neither the username nor the password ever reach the cache.
+# An entry is dropped when:
+#   - the TTL runs out
+#   - the user's password changes (the entry remembers a digest of the
+#     stored password hash and is compared against it on every hit)
+#   - the user logs out: the entry remembers the user's logout
+#     generation (Person.credentials_generation), which log_out/ bumps in
+#     the database, so no cache eviction or other worker can bring an
+#     entry from before the log out back
+
+
+def _digest(*parts):
+    message = '\0'.join(parts).encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def _credentials_key(username, password):
+    return 'credentials:' + _digest(username, password)
+
+
+def _generation(user):
+    try:
+        return user.person.credentials_generation
+    except Person.DoesNotExist:
+        return 0
+
+
+def cached_authenticate(username, password):
+    key = _credentials_key(username, password)
+    entry = cache.get(key)
+
+    if entry is not None:
+        user_id, password_digest, generation = entry
+        user = User.objects.filter(pk=user_id, is_active=True).select_related('person').first()
+
+        if (user is not None and _generation(user) == generation
+                and hmac.compare_digest(_digest(user.password), password_digest)):
+            return user
+
+        cache.delete(key)
+
+    with timed('auth'):
+        user = authenticate(username=username, password=password)
+
+    # failed attempts are never cached so guessing stays expensive
+    if user is not None:
+        cache.set(key, (user.pk, _digest(user.password), _generation(user)), settings.CREDENTIAL_CACHE_TTL)
+
+    return user
+
+
+def forget_credentials(user):
+    generation = F('credentials_generation') + 1
+    if not Person.objects.filter(user=user).update(credentials_generation=generation):
+        Person.objects.get_or_create(user=user, defaults={'credentials_generation': 1})
+
+
+# Authentication for the endpoints that take credentials in the request
+# body. A valid `Authorization: Token <key>` header (see log_in/) is
+# accepted instead of the username and password.
+# Raises KeyError if neither a token nor username/password were sent.
+def authenticate_request(request):
+    if request.auth is not None:
+        return request.user
+
+    return cached_authenticate(request.data['username'], request.data['password'])
@@ -0,0 +1,35 @@
+from django.db import connections
+
+
+# CONN_HEALTH_CHECKS is only built into Django 4.1 and later. On older
+# versions these handlers do the same job: persistent connections that
+# went away (database restart, idle timeout on the server or a proxy)
+# are closed before the request gets to use them, and Django opens a
+# fresh one on the first query.
+#
+# Like Django 4.1 the check is lazy. check_connections (request_started)
+# only marks the open connections as due for a check; a connection is
+# pinged when the request first uses it, so replicas and other aliases
+# the request never touches cost nothing.
+def check_connections(**kwargs):
+    for connection in connections.all():
+        if connection.settings_dict.get('CONN_HEALTH_CHECKS') and connection.connection is not None:
+            connection.health_check_due = True
+
+
+# connection_created handler: makes the connection run its pending check
+# before the next cursor is handed out
+def install_health_check(connection, **kwargs):
+    if not connection.settings_dict.get('CONN_HEALTH_CHECKS') or hasattr(connection, 'health_check_due'):
+        return
+    connection.health_check_due = False
+    ensure_connection = connection.ensure_connection
+
+    def checked_ensure_connection():
+        if connection.health_check_due:
+            connection.health_check_due = False
+            if connection.connection is not None and not connection.is_usable():
+                connection.close()
+        ensure_connection()
+
+    connection.ensure_connection = checked_ensure_connection
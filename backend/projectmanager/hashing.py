@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from rest_framework.exceptions import Throttled
+
+# Password hashing takes 50-150ms of CPU. Account creation and log_in/
+# hash on this small pool instead of in the request thread, and only
+# HASHING_WORKERS + HASHING_QUEUE requests may be hashing or waiting
+# for it at a time; beyond that they are turned away with a 429 right
+# away, so signup bursts can't tie up every request thread. The hash
+# functions release the GIL, the pool runs them in parallel. The bound
+# is per process.
+#
+# Only the hashing itself runs on the pool, database access stays on
+# the request's thread (and connection).
+
+executor = ThreadPoolExecutor(max_workers=settings.HASHING_WORKERS,
+                              thread_name_prefix='projectmanager-hashing')
+_slots = threading.BoundedSemaphore(settings.HASHING_WORKERS + settings.HASHING_QUEUE)
+
+# seconds a turned away client is asked to wait
+RETRY_AFTER = 1
+
+
+def run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise Throttled(wait=RETRY_AFTER, detail="too many password checks in progress, try again later")
+
+    try:
+        return executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    return run(hashers.make_password, password)
+
+
+# what User.objects.create_user does, with the hashing on the pool
+def create_user(username, email, password, **extra_fields):
+    user = User(username=User.normalize_username(username),
+                email=User.objects.normalize_email(email), **extra_fields)
+    user.password = hash_password(password)
+    user.save()
+    return user
+
+
+# ModelBackend's checks with the hashing on the pool; returns the
+# active user or None
+def authenticate(username, password):
+    user = User.objects.filter(username=username).first()
+
+    if user is None:
+        # hash anyway so a missing user takes as long as a bad password
+        hash_password(password)
+        return None
+
+    if not run(hashers.check_password, password, user.password) or not user.is_active:
+        return None
+
+    # rehash with the current PASSWORD_HASHER (or its new parameters)
+    preferred = hashers.get_hasher()
+    if hashers.identify_hasher(user.password).algorithm != preferred.algorithm or \
+            preferred.must_update(user.password):
+        user.password = hash_password(password)
+        user.save(update_fields=['password'])
+
+    return user
+
+
+# PASSWORD_HASHER=scrypt / argon2 with the parameters from settings
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = settings.SCRYPT_WORK_FACTOR
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
@@ -0,0 +1,147 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (override_settings, setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+
+from projectmanager import benchmarks
+
+
+# Seeds a throwaway test database (SQLite or the configured Postgres,
+# see DB_ENGINE) and times every endpoint with the Django test client:
+#
+#   python manage.py benchmark --users 200 --projects 10 --save-baseline bench.json
+#   python manage.py benchmark --baseline bench.json --fail-on-regression
+#
+# For concurrent load against a running server see locustfile.py.
+class Command(BaseCommand):
+    help = 'Times every projectmanager endpoint against a seeded test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--projects', type=int, default=10, help='projects per user')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--only', nargs='+', help='scenario names to run')
+        parser.add_argument('--json', help='write the results to this file')
+        parser.add_argument('--save-baseline', help='store the results as the baseline in this file')
+        parser.add_argument('--baseline', help='compare against the baseline in this file')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='allowed p50 slowdown against the baseline (0.2 = 20%%)')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--signups', type=int, default=0,
+                            help='also measure signup throughput with this many concurrent create_account requests')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--payload', action='store_true',
+                            help='also measure rendering and compression of a listing of every project')
+        parser.add_argument('--lookup-sizes', type=int, nargs='+', default=[],
+                            help='also time title lookups with this many projects, e.g. 10000 100000 1000000')
+        parser.add_argument('--search-sizes', type=int, nargs='+', default=[],
+                            help='also time search/ queries with this many projects, e.g. 10000 100000 1000000')
+        parser.add_argument('--writes', type=int, default=0,
+                            help='also measure body-authenticated writes per second with and without the credential cache')
+        parser.add_argument('--batch', type=int, default=0,
+                            help='also compare creating this many projects one request each and through batch/')
+        parser.add_argument('--uploads', type=int, default=0,
+                            help='also measure memory and disk use of this many thumbnail uploads')
+        parser.add_argument('--distinct', type=int, default=5, help='different images among the --uploads')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['iterations'] < 1:
+            raise CommandError('--users and --iterations must be at least 1')
+
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            # the rate limits would turn the repeated requests away
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, THROTTLE_ENABLED=False):
+                extras = {}
+
+                # these need the seeded data set, which flush_database wipes
+                def seeded():
+                    if options['payload']:
+                        extras['payload'] = benchmarks.payload()
+                    if options['uploads']:
+                        extras['uploads'] = benchmarks.upload_usage(options['uploads'], max(options['distinct'], 1))
+
+                results = benchmarks.run(options['users'], options['projects'], options['iterations'],
+                                         options['only'], seeded)
+                payload, uploads = extras.get('payload'), extras.get('uploads')
+                if options['signups']:
+                    signups = benchmarks.signup_throughput(options['signups'], options['concurrency'])
+                if options['lookup_sizes']:
+                    lookups = benchmarks.title_lookups(options['lookup_sizes'])
+                if options['search_sizes']:
+                    searches = benchmarks.search_lookups(options['search_sizes'])
+                if options['writes']:
+                    writes = benchmarks.write_throughput(options['writes'])
+                if options['batch']:
+                    batch = benchmarks.batch_throughput(options['batch'])
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write('%-20s %6s %10s %10s %10s %8s' % ('scenario', 'n', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for name, result in results.items():
+            self.stdout.write('%-20s %6d %10.2f %10.2f %10.2f %8.1f' % (
+                name, result['iterations'], result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries']))
+
+        if options['payload']:
+            self.stdout.write('payload of %d projects: serializer %.0f ms, projector %.0f ms (%s), render %s ms, '
+                              'bytes %s, compression %s ms' % (
+                payload['projects'], payload['serializer_ms'], payload['projector_ms'],
+                'identical' if payload['projector_identical'] else 'DIFFERENT',
+                ', '.join('%s %.1f' % item for item in payload['render_ms'].items()),
+                ', '.join('%s %d' % item for item in payload['bytes'].items()),
+                ', '.join('%s %.1f' % item for item in payload['compress_ms'].items())))
+
+        if options['signups']:
+            self.stdout.write('signups: %(created_per_second).1f/s with %(concurrency)d clients, statuses %(statuses)s' % signups)
+
+        if options['lookup_sizes']:
+            for size, result in lookups.items():
+                self.stdout.write('title lookup with %d projects: p50 %.3f ms, p99 %.3f ms' % (
+                    size, result['p50_ms'], result['p99_ms']))
+
+        if options['search_sizes']:
+            for size, result in searches.items():
+                self.stdout.write('search with %d projects: p50 %.3f ms, p99 %.3f ms' % (
+                    size, result['p50_ms'], result['p99_ms']))
+
+        if options['writes']:
+            self.stdout.write('writes: %(uncached_per_second).1f/s verifying every password, '
+                              '%(cached_per_second).1f/s with the credential cache' % writes)
+
+        if options['batch']:
+            self.stdout.write('creates: %(single_per_second).1f/s one per request, '
+                              '%(batch_per_second).1f/s through batch/ (%(operations)d projects)' % batch)
+
+        if options['uploads']:
+            self.stdout.write('uploads: %d of %d images, %.1f ms each, peak memory %.1f MB, '
+                              '%.1f MB uploaded, %.1f MB stored' % (
+                uploads['uploads'], uploads['distinct'], uploads['ms_per_upload'], uploads['peak_memory'] / 2**20,
+                uploads['uploaded_bytes'] / 2**20, uploads['stored_bytes'] / 2**20))
+
+        for path in (options['json'], options['save_baseline']):
+            if path:
+                with open(path, 'w') as f:
+                    json.dump(results, f, indent=2, sort_keys=True)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+            for name, result in results.items():
+                if name in baseline:
+                    self.stdout.write('%-20s p50 %+7.1f%%  queries %+.1f' % (
+                        name,
+                        (result['p50_ms'] / baseline[name]['p50_ms'] - 1) * 100 if baseline[name]['p50_ms'] else 0,
+                        result['queries'] - baseline[name]['queries']))
+
+            regressed = benchmarks.regressions(results, baseline, options['tolerance'])
+            if regressed:
+                message = 'regressed: ' + ', '.join(regressed)
+                if options['fail_on_regression']:
+                    raise CommandError(message)
+                self.stdout.write(self.style.WARNING(message))
@@ -0,0 +1,42 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from projectmanager import transfer
+
+
+# Streams users (with their job title) or projects to NDJSON or CSV:
+#
+#   python manage.py export_projects users.ndjson --model users
+#   python manage.py export_projects projects.csv --model projects
+#
+# The exported users carry their password hashes, keep the files safe.
+class Command(BaseCommand):
+    help = 'Exports users or projects as NDJSON or CSV (COPY on Postgres).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='file to write, - for stdout')
+        parser.add_argument('--model', choices=sorted(transfer.FIELDS), default='projects')
+        parser.add_argument('--format', choices=('ndjson', 'csv'),
+                            help='defaults to csv for .csv files, ndjson otherwise')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = options['output']
+        format = options['format'] or ('csv' if output.endswith('.csv') else 'ndjson')
+        # progress goes to stderr, stdout may be the export itself
+        progress = None
+        if options['verbosity'] > 1:
+            progress = lambda count: self.stderr.write('%d rows' % count)
+
+        started = time.perf_counter()
+        if output == '-':
+            count = transfer.export(options['model'], format, sys.stdout, options['batch_size'], progress)
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as f:
+                count = transfer.export(options['model'], format, f, options['batch_size'], progress)
+        seconds = time.perf_counter() - started
+
+        self.stderr.write('exported %d %s in %.1fs (%.0f rows/s)' % (
+            count, options['model'], seconds, transfer.rate(count, seconds)))
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projectmanager import transfer
+
+
+# Loads users or projects written by export_projects (or by hand) in
+# batches; import users before the projects that refer to them:
+#
+#   python manage.py import_projects users.ndjson --model users
+#   python manage.py import_projects projects.csv --model projects
+#
+# Usernames and titles that exist already are skipped. Passwords that
+# aren't Django hashes are hashed on --workers processes.
+class Command(BaseCommand):
+    help = 'Imports users or projects from NDJSON or CSV (COPY on Postgres).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='file to read, - for stdin')
+        parser.add_argument('--model', choices=sorted(transfer.FIELDS), default='projects')
+        parser.add_argument('--format', choices=('ndjson', 'csv'),
+                            help='defaults to csv for .csv files, ndjson otherwise')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='processes hashing plain text passwords')
+        parser.add_argument('--no-copy', action='store_true', help="use bulk_create even on Postgres")
+
+    def handle(self, *args, **options):
+        input = options['input']
+        format = options['format'] or ('csv' if input.endswith('.csv') else 'ndjson')
+        progress = None
+        if options['verbosity'] > 1:
+            progress = lambda count: self.stderr.write('%d rows' % count)
+
+        importer = transfer.Importer(options['model'], format, options['batch_size'], options['workers'],
+                                     use_copy=not options['no_copy'], progress=progress)
+
+        started = time.perf_counter()
+        try:
+            if input == '-':
+                count = importer.run(sys.stdin)
+            else:
+                with open(input, newline='', encoding='utf-8') as f:
+                    count = importer.run(f)
+        except (KeyError, ValueError) as e:
+            raise CommandError('bad input: %s' % e)
+        seconds = time.perf_counter() - started
+
+        self.stderr.write('imported %d %s in %.1fs (%.0f rows/s)' % (
+            count, options['model'], seconds, transfer.rate(count, seconds)))
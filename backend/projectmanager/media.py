@@ -0,0 +1,122 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .storage import is_hashed
+
+# Serves MEDIA_ROOT in production (django.conf.urls.static only works
+# with DEBUG = True). MEDIA_SERVE_MODE picks how the bytes get out:
+#   "django"            FileResponse, which the WSGI server can send
+#                       with sendfile(); single byte ranges are supported
+#   "x-sendfile"        the X-Sendfile header for Apache/lighttpd
+#   "x-accel-redirect"  the X-Accel-Redirect header for nginx, pointing
+#                       to an internal location at MEDIA_ACCEL_PREFIX
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+
+    try:
+        stat = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+    elif mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+    else:
+        response = file_response(request, fullpath, stat.st_size, content_type)
+
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = IMMUTABLE if is_hashed(path) else REVALIDATE
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def file_response(request, fullpath, size, content_type):
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is None:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+    elif byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(fullpath, start, end),
+                                         status=206, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+# returns (first, last) byte positions, 'unsatisfiable', or None when
+# the whole file should be sent (no header, multiple or invalid ranges)
+def parse_range(header, size):
+    if not header:
+        return None
+
+    match = RANGE.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+
+    if start == '':
+        # suffix range, the last `end` bytes
+        length = int(end)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+
+    return start, min(end, size - 1)
+
+
+def read_range(fullpath, start, end):
+    with open(fullpath, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
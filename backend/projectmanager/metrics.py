@@ -0,0 +1,169 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.http import HttpResponse
+
+from . import readcache, throttling
+
+# Per-request performance numbers (see middleware.MetricsMiddleware)
+# aggregated into Prometheus histograms, served at /metrics.
+# Everything is kept per worker process.
+
+_lock = threading.Lock()
+
+# timings of the request being handled, None when it isn't sampled;
+# context variables follow the request into sync_to_async threads
+current = ContextVar('request_timings', default=None)
+
+
+class Timings:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.queries = 0
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+
+# adds the time spent in the block to the current request's timings
+@contextmanager
+def timed(name):
+    timings = current.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+# installed on every database connection (see connection_created below)
+def query_timer(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add('db', time.perf_counter() - started)
+
+
+def install_query_timer(connection, **kwargs):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return '+Inf' if value == math.inf else repr(float(value))
+
+
+class Histogram:
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, endpoint, value):
+        with _lock:
+            series = self.series.get(endpoint)
+            if series is None:
+                series = self.series[endpoint] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.description),
+            '# TYPE %s histogram' % self.name,
+        ]
+        with _lock:
+            series = sorted((endpoint, list(counts), total)
+                            for endpoint, (counts, total) in self.series.items())
+
+        for endpoint, counts, total in series:
+            endpoint = _escape(endpoint)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append('%s_bucket{endpoint="%s",le="%s"} %d' % (self.name, endpoint, _number(bound), cumulative))
+            lines.append('%s_sum{endpoint="%s"} %s' % (self.name, endpoint, _number(total)))
+            lines.append('%s_count{endpoint="%s"} %d' % (self.name, endpoint, cumulative))
+
+        return lines
+
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+request_seconds = Histogram('projectmanager_request_seconds', 'Wall time per request.', SECONDS)
+db_seconds = Histogram('projectmanager_db_seconds', 'Time spent in database queries per request.', SECONDS)
+db_queries = Histogram('projectmanager_db_queries', 'Database queries per request.',
+                       (0, 1, 2, 3, 5, 10, 20, 50, 100))
+auth_seconds = Histogram('projectmanager_auth_seconds', 'Time spent verifying credentials per request.', SECONDS)
+serialize_seconds = Histogram('projectmanager_serialize_seconds', 'Time spent in DRF serializers per request.', SECONDS)
+response_bytes = Histogram('projectmanager_response_bytes', 'Response body size.',
+                           (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+
+HISTOGRAMS = [request_seconds, db_seconds, db_queries, auth_seconds, serialize_seconds, response_bytes]
+
+
+def record(endpoint, timings, total, size):
+    request_seconds.observe(endpoint, total)
+    db_seconds.observe(endpoint, timings.durations.get('db', 0.0))
+    db_queries.observe(endpoint, timings.queries)
+    if 'auth' in timings.durations:
+        auth_seconds.observe(endpoint, timings.durations['auth'])
+    if 'serialize' in timings.durations:
+        serialize_seconds.observe(endpoint, timings.durations['serialize'])
+    if size is not None:
+        response_bytes.observe(endpoint, size)
+
+
+def counter_lines(name, description, values):
+    lines = ['# HELP %s %s' % (name, description), '# TYPE %s counter' % name]
+    for label, value in sorted(values.items()):
+        lines.append('%s{%s} %d' % (name, label, value))
+    return lines
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+
+    cache_stats = readcache.get_stats()
+    lines += counter_lines('projectmanager_read_cache_total', 'Read cache lookups and invalidations.',
+                           {'event="%s"' % event: count for event, count in cache_stats.items()})
+
+    outcomes, in_flight = throttling.get_stats()
+    lines += counter_lines('projectmanager_throttle_total',
+                           'Requests per throttle scope allowed, throttled (rate) or shed (concurrency).',
+                           {'scope="%s",outcome="%s"' % key: count for key, count in outcomes.items()})
+    lines += ['# HELP projectmanager_in_flight Requests of a throttle scope running now.',
+              '# TYPE projectmanager_in_flight gauge']
+    for scope, count in sorted(in_flight.items()):
+        lines.append('projectmanager_in_flight{scope="%s"} %d' % (scope, count))
+
+    return '\n'.join(lines) + '\n'
+
+
+# Prometheus scrape endpoint
+def metrics_view(request):
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,220 @@
+import asyncio
+import gzip
+import hashlib
+import random
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics, routers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Records wall time, database queries and time, credential checks,
+# serializer time and response size for a sample of the requests
+# (METRICS_SAMPLE_RATE, 0 to 1). Sampled responses carry a
+# Server-Timing header; the aggregates are served at /metrics.
+# Works for both the WSGI and the ASGI deployment.
+class MetricsMiddleware(MiddlewareMixin):
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        if not self.sampled():
+            return self.get_response(request)
+
+        timings = metrics.Timings()
+        token = metrics.current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timings = metrics.Timings()
+        token = metrics.current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+
+        return self.finish(request, response, timings)
+
+    def sampled(self):
+        rate = settings.METRICS_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def finish(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.route if match is not None else 'unmatched'
+        size = None if response.streaming else len(response.content)
+
+        metrics.record(endpoint, timings, total, size)
+
+        entries = ['total;dur=%.1f' % (total * 1000),
+                   'db;dur=%.1f;desc="%d queries"' % (timings.durations.get('db', 0.0) * 1000, timings.queries)]
+        for name in ('auth', 'serialize'):
+            if name in timings.durations:
+                entries.append('%s;dur=%.1f' % (name, timings.durations[name] * 1000))
+        response['Server-Timing'] = ', '.join(entries)
+
+        return response
+
+
+# content that is compressed already or not worth the CPU
+INCOMPRESSIBLE = ('image/', 'video/', 'audio/', 'application/zip', 'application/gzip', 'font/woff')
+
+
+def accepted_encodings(request):
+    accepted = {}
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.lower()] = quality
+    return accepted
+
+
+def choose_encoding(request):
+    accepted = accepted_encodings(request)
+    wildcard = accepted.get('*', 0)
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def compress(coding, content):
+    if coding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(coding, chunks):
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+
+    compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# Compresses responses of at least COMPRESSION_MIN_SIZE bytes with
+# brotli (when the brotli package is installed) or gzip, whichever the
+# client accepts. Streamed responses are compressed as they go.
+#
+# With COMPRESSION_CACHE_TTL set, the compressed body of a response
+# with an ETag (see conditional.py) is cached, so a listing is
+# compressed once per change instead of once per request.
+class CompressionMiddleware(MiddlewareMixin):
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (206, 304):
+            return response
+        if response.get('Content-Type', '').startswith(INCOMPRESSIBLE):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        # the representation depends on Accept-Encoding from here on
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        coding = choose_encoding(request)
+        if coding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(coding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            response.content = self.compressed_content(request, response, coding)
+            response['Content-Length'] = str(len(response.content))
+
+        # the compressed bytes differ, the entity is the same
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        response['Content-Encoding'] = coding
+        return response
+
+    def compressed_content(self, request, response, coding):
+        etag = response.get('ETag')
+        if not settings.COMPRESSION_CACHE_TTL or not etag:
+            return compress(coding, response.content)
+
+        # the ETag alone isn't unique: view_project/ and get_thumbnail/
+        # share it, and the content type depends on content negotiation
+        key = 'compressed:' + hashlib.sha1('\0'.join(
+            (coding, request.get_full_path(), response.get('Content-Type', ''), etag)).encode()).hexdigest()
+
+        content = cache.get(key)
+        if content is None:
+            content = compress(coding, response.content)
+            cache.set(key, content, settings.COMPRESSION_CACHE_TTL)
+        return content
+
+
+# Routes the reads of GET/HEAD/OPTIONS requests to a read replica and
+# pins clients that wrote something to the primary, see routers.py.
+# Only installed when DB_REPLICAS is set.
+class ReplicaMiddleware(MiddlewareMixin):
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        token = routers.current_replica.set(routers.replica_for(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.current_replica.reset(token)
+
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = routers.current_replica.set(routers.replica_for(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.current_replica.reset(token)
+
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        if request.method not in routers.SAFE_METHODS and response.status_code < 400:
+            routers.pin(request, response)
+        return response
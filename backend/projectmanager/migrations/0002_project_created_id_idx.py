@@ -0,0 +1,17 @@
+# Generated by Django 4.0 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['date_created', 'id'], name='project_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+# Project titles were only checked for uniqueness in the view, so
+# concurrent creates could leave duplicates behind. Keep the oldest
+# project under each title and suffix the others with their id before
+# the unique constraint is added.
+def dedupe_titles(apps, schema_editor):
+    Project = apps.get_model('projectmanager', 'Project')
+    max_length = Project._meta.get_field('title').max_length
+
+    duplicates = list(Project.objects.values('title')
+                      .annotate(count=Count('id'))
+                      .filter(count__gt=1)
+                      .values_list('title', flat=True))
+
+    for title in duplicates:
+        projects = Project.objects.filter(title=title).order_by('id')[1:]
+        for project in projects:
+            # a suffixed title may be taken already, e.g. by a project
+            # really called "foo-12"
+            suffix = '-%d' % project.id
+            attempt = 1
+            while True:
+                candidate = title[:max_length - len(suffix)] + suffix
+                if not Project.objects.filter(title=candidate).exists():
+                    break
+                attempt += 1
+                suffix = '-%d-%d' % (project.id, attempt)
+
+            project.title = candidate
+            project.save(update_fields=['title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0002_project_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_titles, migrations.RunPython.noop),
+    ]
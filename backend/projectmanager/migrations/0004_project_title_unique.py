@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0003_dedupe_project_titles'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='title',
+            field=models.CharField(max_length=25, unique=True),
+        ),
+    ]
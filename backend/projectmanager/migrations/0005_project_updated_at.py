@@ -0,0 +1,26 @@
+# Generated by Django 4.0 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+# existing projects were last modified when they were created as far
+# as we know
+def backfill_updated_at(apps, schema_editor):
+    Project = apps.get_model('projectmanager', 'Project')
+    Project.objects.update(updated_at=models.F('date_created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0004_project_title_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.0 on 2026-10-18 14:58
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+# Postgres only: index the stored vectors and fill them in for the
+# existing projects. SQLite gets an FTS5 table instead, which is
+# (re)created after every migrate, see search.install_sqlite_fts.
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(
+        'CREATE INDEX project_search_idx ON projectmanager_project USING gin (search_vector)'
+    )
+
+    Project = apps.get_model('projectmanager', 'Project')
+    Project.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='english') +
+        SearchVector('short_description', weight='B', config='english') +
+        SearchVector('long_description', weight='C', config='english') +
+        SearchVector('contributions', weight='D', config='english')
+    ))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS project_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0005_project_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0 on 2026-10-18 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0006_project_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['user', 'date_created', 'id'], name='project_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0007_project_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=25)),
+                ('deleted_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['updated_at', 'id'], name='project_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projecttombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0008_project_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='credentials_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
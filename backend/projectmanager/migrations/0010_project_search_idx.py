@@ -0,0 +1,33 @@
+# Generated by Django 4.0 on 2026-10-18 15:59
+
+from django.db import migrations
+import projectmanager.models
+
+
+# 0006 created the GIN index with raw SQL, out of sight of the
+# migration state; it is recreated below as a model index
+def drop_raw_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS project_search_idx')
+
+
+def create_raw_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX project_search_idx ON projectmanager_project USING gin (search_vector)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0009_person_credentials_generation'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_raw_search_index, create_raw_search_index),
+        migrations.AddIndex(
+            model_name='project',
+            index=projectmanager.models.SearchVectorIndex(fields=['search_vector'], name='project_search_idx'),
+        ),
+    ]
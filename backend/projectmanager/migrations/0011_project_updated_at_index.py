@@ -0,0 +1,19 @@
+# Generated by Django 4.0 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+# project_updated_id_idx (0008) covers updated_at on its own as well
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmanager', '0010_project_search_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import connections, models, router
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -11,18 +13,100 @@ from django.dispatch import receiver
 class Person(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     job_title = models.CharField(max_length=50, blank=True, null=True)
+    # bumped by log_out/, orphans the user's cached credentials
+    # (see credentials.py)
+    credentials_generation = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.user.first_name
 
+# GIN index of the stored search vectors on Postgres. Other databases
+# (SQLite in development) search through FTS5 and never fill the
+# column, they get a plain index on it.
+class SearchVectorIndex(GinIndex):
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return models.Index.create_sql(self, model, schema_editor, using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+
 class Project(models.Model):
     user = models.ForeignKey(User, blank=True, null=True, on_delete=models.CASCADE)
-    title = models.CharField(max_length=25)
+    title = models.CharField(max_length=25, unique=True)
     long_description = models.TextField(blank=True, null=True)
     short_description = models.CharField(max_length=150, blank=True, null=True)
     contributions = models.TextField(blank=True, null=True)
     thumbnail = models.ImageField(upload_to='images/', blank=True, null=True)
     date_created = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
+    # only used on Postgres (GIN indexed), SQLite uses an FTS5 table, see search.py
+    search_vector = SearchVectorField(blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            SearchVectorIndex(fields=['search_vector'], name='project_search_idx'),
+            # keyset pagination of the projects/ listing
+            models.Index(fields=['date_created', 'id'], name='project_created_id_idx'),
+            # a user's projects in profile/ order
+            models.Index(fields=['user', 'date_created', 'id'], name='project_user_created_idx'),
+            # the changes/ feed, and the newest updated_at of the listing
+            # validators (see conditional.py)
+            models.Index(fields=['updated_at', 'id'], name='project_updated_id_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def save(self, *args, **kwargs):
+        # the vector is computed from the values being saved, in the
+        # same INSERT or UPDATE
+        using = kwargs.get('using') or router.db_for_write(Project, instance=self)
+        update_fields = kwargs.get('update_fields')
+        if connections[using].vendor == 'postgresql' and (
+                update_fields is None or set(update_fields) & set(SEARCH_WEIGHTS)):
+            self.search_vector = search_document(
+                lambda name: models.Value(getattr(self, name), output_field=models.TextField()))
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'search_vector'}
+        super().save(*args, **kwargs)
+
+
+# records a deleted project for the changes/ feed, see changes.py
+class ProjectTombstone(models.Model):
+    project_id = models.BigIntegerField()
+    title = models.CharField(max_length=25)
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+
+# full-text search document of a project, title weighted highest
+SEARCH_CONFIG = 'english'
+SEARCH_WEIGHTS = {'title': 'A', 'short_description': 'B', 'long_description': 'C', 'contributions': 'D'}
+
+
+# the document built from value(field name) for each field, the
+# columns themselves by default
+def search_document(value=models.F):
+    vectors = [SearchVector(value(name), weight=weight, config=SEARCH_CONFIG)
+               for name, weight in SEARCH_WEIGHTS.items()]
+    document = vectors[0]
+    for vector in vectors[1:]:
+        document = document + vector
+    return document
+
+
+SEARCH_VECTOR = search_document()
+
+# recomputes the stored search vector of the given projects; needed
+# after writes that bypass save() such as bulk_create/bulk_update
+def update_search_vectors(projects):
+    if connections[projects.db].vendor == 'postgresql':
+        projects.update(search_vector=SEARCH_VECTOR)
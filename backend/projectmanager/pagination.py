@@ -0,0 +1,136 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# Keyset (cursor) pagination. Instead of OFFSET, every page starts
+# right after the ordering key of the last row of the previous page,
+# so fetching page 1000 costs the same as fetching page 1.
+# Nullable ordering fields are sorted NULLS LAST on every database.
+class KeysetPaginator:
+
+    def __init__(self, ordering, cursor_param='cursor', limit_param='limit'):
+        self.ordering = tuple(ordering)
+        self.cursor_param = cursor_param
+        self.limit_param = limit_param
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.GET.get(self.limit_param, DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+
+        if limit < 1:
+            raise ValueError("limit must be positive")
+
+        return min(limit, MAX_PAGE_SIZE)
+
+    def order(self, queryset):
+        ordering = []
+        for name in self.ordering:
+            if queryset.model._meta.get_field(name).null:
+                ordering.append(F(name).asc(nulls_last=True))
+            else:
+                ordering.append(name)
+        return queryset.order_by(*ordering)
+
+    def after(self, queryset, values):
+        model = queryset.model
+        condition = Q()
+        prefix = {}
+
+        for name, value in zip(self.ordering, values):
+            nullable = model._meta.get_field(name).null
+
+            # with NULLS LAST nothing sorts after a NULL in this column,
+            # only the following columns can still break the tie
+            if value is not None:
+                greater = Q(**{name + '__gt': value})
+                if nullable:
+                    greater |= Q(**{name + '__isnull': True})
+                condition |= Q(**prefix) & greater
+                prefix[name] = value
+            else:
+                prefix[name + '__isnull'] = True
+
+        return queryset.filter(condition)
+
+    # the cursor's values converted by the ordering fields, so a cursor
+    # that decodes but holds the wrong types is a ValueError instead of
+    # failing in the query
+    def cursor_values(self, model, cursor):
+        values = decode_cursor(cursor)
+        if len(values) != len(self.ordering):
+            raise ValueError("invalid cursor")
+
+        converted = []
+        for name, value in zip(self.ordering, values):
+            field = model._meta.get_field(name)
+            if value is None and field.null:
+                converted.append(None)
+                continue
+            if value is None or isinstance(value, (list, dict, bool)):
+                raise ValueError("invalid cursor")
+            try:
+                value = field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise ValueError("invalid cursor")
+            converted.append(value)
+        return converted
+
+    # returns (rows, next_cursor); rows is a list of at most `limit` items
+    def paginate(self, queryset, request, key=None):
+        limit = self.get_limit(request)
+        queryset = self.order(queryset)
+
+        cursor = request.GET.get(self.cursor_param)
+        if cursor:
+            queryset = self.after(queryset, self.cursor_values(queryset.model, cursor))
+
+        # fetch one extra row to know whether there is a next page
+        rows = list(queryset[:limit + 1])
+        if len(rows) <= limit:
+            return rows, None
+
+        rows = rows[:limit]
+        if key is None:
+            key = lambda row: [getattr(row, name) for name in self.ordering]
+        return rows, encode_cursor(key(rows[-1]))
+
+    def next_link(self, request, next_cursor):
+        url = request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_param)
+        return '<%s>; rel="next"' % replace_query_param(url, self.cursor_param, next_cursor)
+
+    # the body stays a plain list; the next page is advertised
+    # through a Link header (RFC 8288) like the GitHub API does
+    def add_headers(self, response, request, next_cursor):
+        if next_cursor:
+            response['Link'] = self.next_link(request, next_cursor)
+            response['X-Next-Cursor'] = next_cursor
+        return response
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if hasattr(v, 'isoformat') else v for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+    if not isinstance(values, list):
+        raise ValueError("invalid cursor")
+
+    return values
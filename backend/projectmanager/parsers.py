@@ -0,0 +1,43 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+# Newline delimited JSON (one JSON document per line), parsed into a
+# list. Lines are decoded one at a time as they are read from the
+# request body, and reading stops with a ParseError as soon as there
+# are more than get_max_items() of them.
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+    max_items = None
+
+    def get_max_items(self):
+        return self.max_items
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        max_items = self.get_max_items()
+
+        items = []
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if max_items is not None and len(items) == max_items:
+                raise ParseError('at most %d documents per request' % max_items)
+            try:
+                items.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError('NDJSON parse error on line %d - %s' % (number, exc))
+
+        return items
+
+
+# batch/ operations, one per line
+class BatchNDJSONParser(NDJSONParser):
+
+    def get_max_items(self):
+        return settings.BATCH_MAX_OPERATIONS
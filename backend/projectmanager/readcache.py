@@ -0,0 +1,164 @@
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import Http404
+
+from .conditional import page_validators
+from .projectors import profile_projector
+from .models import Project
+from .pagination import KeysetPaginator
+from .routers import from_primary
+
+# Read-through cache for the hot read endpoints (view_project,
+# get_thumbnail and profile). Entries are dropped by the signal
+# handlers in signals.py whenever the rows behind them change, and
+# expire after READ_CACHE_TTL seconds in any case. "Does not exist"
+# is cached too: creating the row sends post_save, which drops it.
+# Misses are always loaded from the primary (see routers.py).
+#
+# Deletes that send no signals (delete_all_projects/, flush_database/)
+# call forget_all() instead: entries carry the generation they were
+# stored under and only count while it is the current one.
+
+_MISSING = object()
+GENERATION_KEY = 'read-cache-generation'
+_lock = threading.Lock()
+
+# per-process counters, see cache_stats/
+stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _count(name, amount=1):
+    with _lock:
+        stats[name] += amount
+
+
+def get_stats():
+    with _lock:
+        return dict(stats)
+
+
+# titles and usernames may contain characters memcached/redis keys can't
+def _digest(value):
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+def project_key(title):
+    return 'project:' + _digest(title)
+
+
+def user_id_key(username):
+    return 'user-id:' + _digest(username)
+
+
+# holds the version of the user's cached profile pages, deleting it
+# orphans every page cached before
+def profile_key(user_id):
+    return 'profile:%s' % user_id
+
+
+def profile_page_key(user_id, version, cursor, limit):
+    return 'profile-page:%s:%s:%s' % (user_id, version, _digest('%s:%s' % (cursor, limit)))
+
+
+def cached(key, compute):
+    found = cache.get_many([key, GENERATION_KEY])
+    generation = found.get(GENERATION_KEY)
+    if key in found and found[key][0] == generation:
+        _count('hits')
+        return found[key][1]
+
+    _count('misses')
+    with from_primary():
+        value = compute()
+    # stored under the generation read before computing it, a
+    # forget_all() in between leaves it stale at once
+    cache.set(key, (generation, value), settings.READ_CACHE_TTL)
+    return value
+
+
+def invalidate(*keys):
+    cache.delete_many(keys)
+    _count('invalidations', len(keys))
+
+
+def forget_all():
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+    _count('invalidations')
+
+
+# drops everything cached about the given projects; called by the
+# signal handlers and by bulk writes, which send no signals
+def forget_projects(projects):
+    keys = set()
+    for project in projects:
+        keys.add(project_key(project.title))
+        if project.user_id is not None:
+            keys.add(profile_key(project.user_id))
+    if keys:
+        invalidate(*keys)
+
+
+# fields of the project needed by view_project and get_thumbnail
+def get_project(title):
+    project = cached(project_key(title), lambda: (
+        Project.objects.filter(title=title)
+        .values('id', 'long_description', 'contributions', 'thumbnail', 'updated_at')
+        .first()
+    ))
+
+    if project is None:
+        raise Http404
+    return project
+
+
+def get_user_id(username):
+    user_id = cached(user_id_key(username), lambda: (
+        User.objects.filter(username=username).values_list('pk', flat=True).first()
+    ))
+
+    if user_id is None:
+        raise Http404
+    return user_id
+
+
+profile_paginator = KeysetPaginator(ordering=('date_created', 'id'))
+
+
+def _profile_version(user_id):
+    key = profile_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, settings.READ_CACHE_TTL):
+            version = cache.get(key, version)
+    return version
+
+
+# a page of the projects listed by profile/, oldest first, as
+# (display, next_cursor, validators); raises ValueError for a bad
+# limit or cursor
+def get_profile(username, request):
+    # a cold request is two queries: the username -> id lookup (cached
+    # apart, it serves every page) and the page itself
+    user_id = get_user_id(username)
+    limit = profile_paginator.get_limit(request)
+    cursor = request.GET.get(profile_paginator.cursor_param)
+
+    def load_page():
+        # only the listed columns, one page at a time, straight off
+        # the (user_id, date_created, id) index
+        projects, get = profile_projector.values(Project.objects.filter(user_id=user_id),
+                                                 ('date_created', 'updated_at'))
+        rows, next_cursor = profile_paginator.paginate(
+            projects, request, key=lambda row: [get(row, 'date_created'), get(row, 'id')])
+
+        versions = [(get(row, 'id'), get(row, 'updated_at')) for row in rows]
+        return profile_projector.project_all(rows), next_cursor, page_validators(versions, next_cursor)
+
+    key = profile_page_key(user_id, _profile_version(user_id), cursor, limit)
+    return cached(key, load_page)
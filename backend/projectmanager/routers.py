@@ -0,0 +1,105 @@
+import hashlib
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Read replicas (DB_REPLICAS, see settings.py). ReplicaMiddleware picks
+# a replica for every GET/HEAD/OPTIONS request, in weighted round-robin
+# order, and ReplicaRouter sends that request's reads to it. Everything
+# else uses the primary: writes, reads in other requests, reads inside
+# a transaction, and code running outside a request (management commands,
+# background tasks).
+#
+# A client that just wrote something is pinned to the primary for
+# REPLICA_PIN_SECONDS so it reads its own writes despite replication
+# lag: by a cookie, and by its Authorization header (kept in the shared
+# cache) for clients that don't keep cookies. Reads that fill a cache
+# go to the primary too (see from_primary()): a row cached from a
+# lagging replica would be served to everyone, pinned clients included.
+
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# alias the current request reads from, None for the primary
+current_replica = ContextVar('read_replica', default=None)
+
+
+# sends the reads of the block to the primary, whatever the request
+@contextmanager
+def from_primary():
+    token = current_replica.set(None)
+    try:
+        yield
+    finally:
+        current_replica.reset(token)
+
+
+class ReplicaCycle:
+
+    def __init__(self, weights):
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle([alias for alias, weight in weights.items() for _ in range(weight)])
+
+    def next(self):
+        with self._lock:
+            return next(self._cycle)
+
+
+_replicas = None
+
+
+def replicas():
+    global _replicas
+    if _replicas is None:
+        _replicas = ReplicaCycle(settings.REPLICA_WEIGHTS)
+    return _replicas
+
+
+def _pin_key(authorization):
+    return 'primary-pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+
+
+def is_pinned(request):
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    return bool(authorization) and cache.get(_pin_key(authorization)) is not None
+
+
+def pin(request, response):
+    response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        cache.set(_pin_key(authorization), 1, settings.REPLICA_PIN_SECONDS)
+
+
+# the replica the request should read from, None for the primary
+def replica_for(request):
+    if not settings.REPLICA_WEIGHTS or request.method not in SAFE_METHODS or is_pinned(request):
+        return None
+    return replicas().next()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        alias = current_replica.get()
+        # a transaction sees its own uncommitted writes only on the primary
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # replicas get the schema through replication
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,97 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections, router
+from django.db.models import F
+
+from .models import SEARCH_CONFIG, Project
+
+# Ranked full-text search over title, short_description,
+# long_description and contributions (weighted in that order).
+#
+# Postgres: Project.search_vector holds the precomputed tsvector
+# (computed by Project.save in the same INSERT or UPDATE), backed by
+# the project_search_idx GIN index, so queries never recompute vectors.
+# SQLite (local development and tests): an FTS5 table kept in sync with
+# projectmanager_project by triggers.
+
+FTS_TABLE = 'projectmanager_project_fts'
+FTS_COLUMNS = ('title', 'short_description', 'long_description', 'contributions')
+# bm25 column weights, mirroring the A/B/C/D weights used on Postgres
+FTS_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+
+# returns the projects matching `text`, best match first; reads go
+# where the router sends them unless `using` is given
+def search_projects(text, offset, limit, using=None):
+    using = using or router.db_for_read(Project)
+    if connections[using].vendor == 'postgresql':
+        query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+        projects = (Project.objects.using(using)
+                    .filter(search_vector=query)
+                    .defer('search_vector')
+                    .annotate(rank=SearchRank(F('search_vector'), query))
+                    .order_by('-rank', 'id'))
+        return list(projects[offset:offset + limit])
+
+    # every word is quoted so FTS5 query syntax in the input is harmless
+    match = ' '.join('"%s"' % word.replace('"', '""') for word in text.split())
+    if not match:
+        return []
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM {table} WHERE {table} MATCH %s '
+            'ORDER BY bm25({table}, {weights}), rowid LIMIT %s OFFSET %s'.format(
+                table=FTS_TABLE, weights=', '.join(map(str, FTS_WEIGHTS))),
+            [match, limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    projects = Project.objects.using(using).in_bulk(ids)
+    return [projects[pk] for pk in ids if pk in projects]
+
+
+def _fts_values(prefix):
+    return ', '.join(prefix + column for column in FTS_COLUMNS)
+
+
+FTS_TRIGGERS = {
+    'project_fts_insert': """
+        CREATE TRIGGER project_fts_insert AFTER INSERT ON projectmanager_project BEGIN
+            INSERT INTO {table} (rowid, {columns}) VALUES (new.id, {new});
+        END""",
+    'project_fts_delete': """
+        CREATE TRIGGER project_fts_delete AFTER DELETE ON projectmanager_project BEGIN
+            INSERT INTO {table} ({table}, rowid, {columns}) VALUES ('delete', old.id, {old});
+        END""",
+    'project_fts_update': """
+        CREATE TRIGGER project_fts_update AFTER UPDATE ON projectmanager_project BEGIN
+            INSERT INTO {table} ({table}, rowid, {columns}) VALUES ('delete', old.id, {old});
+            INSERT INTO {table} (rowid, {columns}) VALUES (new.id, {new});
+        END""",
+}
+
+
+# post_migrate handler. SQLite migrations rebuild a table to alter it,
+# which drops its triggers, so they are checked after every migrate
+# and the index is rebuilt whenever they had to be recreated.
+def install_sqlite_fts(using='default', **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'projectmanager_project'")
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing.issuperset(FTS_TRIGGERS):
+            return
+
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({columns}, "
+            "content='projectmanager_project', content_rowid='id')".format(
+                table=FTS_TABLE, columns=', '.join(FTS_COLUMNS)))
+
+        for name, sql in FTS_TRIGGERS.items():
+            cursor.execute('DROP TRIGGER IF EXISTS %s' % name)
+            cursor.execute(sql.format(table=FTS_TABLE, columns=', '.join(FTS_COLUMNS),
+                                      new=_fts_values('new.'), old=_fts_values('old.')))
+
+        cursor.execute("INSERT INTO {table} ({table}) VALUES ('rebuild')".format(table=FTS_TABLE))
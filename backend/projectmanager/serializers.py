@@ -15,6 +15,21 @@ class ProjectSerializer(serializers.ModelSerializer):
             'thumbnail',
             'date_created'
         )
+        # titles are looked up by update/ and delete_project/ too, so
+        # uniqueness is left to the database constraint (see create)
+        extra_kwargs = {
+            'title': {'validators': []},
+        }
+
+    # optional `fields` argument limits which fields get serialized,
+    # e.g. ProjectSerializer(projects, many=True, fields=['id', 'title'])
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import authentication, readcache
+from .models import Person, Project
+
+
+@receiver([post_save, post_delete], sender=Project)
+def project_changed(sender, instance, **kwargs):
+    readcache.forget_projects([instance])
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    readcache.invalidate(readcache.user_id_key(instance.username),
+                         readcache.profile_key(instance.pk))
+    authentication.forget_user(instance.pk)
+
+
+# profile entries are per user, a change to the user's Person row
+# drops them as well
+@receiver([post_save, post_delete], sender=Person)
+def person_changed(sender, instance, **kwargs):
+    readcache.invalidate(readcache.profile_key(instance.user_id))
+    authentication.forget_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    authentication.forget_tokens(instance.key)
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+# matches names carrying a content hash: content addressed files such
+# as images/<sha256>.png, their renditions
+# (renditions/images/<sha256>.png.256.webp) and files from before,
+# e.g. images/cat.3fa2b1c4d5e6.png
+HASHED_NAME = re.compile(r'(?:^[0-9a-f]{64}|\.[0-9a-f]{12})\.')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def is_hashed(name):
+    return HASHED_NAME.search(os.path.basename(name)) is not None
+
+
+def blob_name(name, digest):
+    directory, basename = os.path.split(name)
+    _, extension = os.path.splitext(basename)
+    return os.path.join(directory, digest + extension.lower())
+
+
+# Content addressed media storage: an uploaded file is stored once as
+# <directory>/<sha256><extension>, however many times and under
+# whatever names it gets uploaded. The name a client sends is never
+# trusted, every save() hashes the content; only renditions, which
+# are named after their original, are stored as named
+# (save_rendition()). A URL always points to the same
+# bytes and can be cached forever by browsers and proxies (see
+# media.serve_media).
+#
+# Uploads are hashed while they are received (uploads.HashingUploadHandler)
+# and moved into place, other content is streamed to a temporary file
+# next to its destination while it is hashed. A file that is stored
+# already is touched instead of written again, which also keeps it
+# from being reclaimed while the project that reuses it gets saved
+# (see tasks.release_thumbnails).
+class HashedMediaStorage(FileSystemStorage):
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.generate_filename(name)
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+
+        digest = getattr(content, 'sha256', None)
+        if digest is not None:
+            source, spooled = content.temporary_file_path(), False
+        elif hasattr(content, 'temporary_file_path'):
+            source, spooled = content.temporary_file_path(), False
+            digest = self.hash_file(source)
+        else:
+            source, digest = self.spool(content, directory)
+            spooled = True
+
+        name = blob_name(name, digest)
+        full_path = self.path(name)
+        try:
+            if os.path.exists(full_path):
+                os.utime(full_path)
+            else:
+                # the same bytes may land here concurrently, either copy will do
+                file_move_safe(source, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        finally:
+            if spooled and os.path.exists(source):
+                os.remove(source)
+
+        return name.replace('\\', '/')
+
+    # for thumbnails.generate_renditions only: the name comes from the
+    # content addressed original, not from a client
+    def save_rendition(self, name, content):
+        return super().save(name, content)
+
+    def hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    # writes `content` to a temporary file in `directory` chunk by chunk,
+    # hashing it on the way; returns (path, hex digest)
+    def spool(self, content, directory):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as f:
+            for chunk in content.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+        return f.name, digest.hexdigest()
@@ -0,0 +1,124 @@
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+
+from .models import Project
+from .thumbnails import RENDITIONS_DIR, delete_renditions, source_name
+
+logger = logging.getLogger(__name__)
+
+# Work that should not hold up a request (file cleanup, image
+# processing...) runs on this small in-process thread pool.
+executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_WORKERS,
+                              thread_name_prefix='projectmanager-task')
+
+
+def submit(fn, *args, **kwargs):
+
+    def run():
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception("background task %s failed", fn.__name__)
+            raise
+        finally:
+            # database connections are per thread, don't leak them
+            connections.close_all()
+
+    return executor.submit(run)
+
+
+# submits fn after `delay` seconds. Like the pool's queue the timer is
+# lost if the process exits first; sweep_thumbnails catches up on the
+# files that leaves behind.
+def submit_later(delay, fn, *args, **kwargs):
+    timer = threading.Timer(delay, submit, (fn,) + args, kwargs)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def walk_storage(directory):
+    try:
+        directories, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+
+    for name in files:
+        yield directory + '/' + name
+    for name in directories:
+        yield from walk_storage(directory + '/' + name)
+
+
+# Deletes the files among `names` (and their renditions) that no
+# project references anymore. Thumbnails are stored once per content
+# (see storage.HashedMediaStorage), the projects pointing to a file are
+# its reference count: a file shared by several projects stays until
+# the last of them is deleted or changes its thumbnail. Files written or
+# reused within `grace` are left alone since their project may not have
+# been saved yet; they are looked at again once the grace has passed.
+def release_thumbnails(names, grace=timedelta(minutes=10)):
+    now = timezone.now()
+    names = set(name for name in names if name)
+    referenced = set(Project.objects.filter(thumbnail__in=names)
+                     .values_list('thumbnail', flat=True))
+    removed = 0
+    pending = {}
+
+    for name in names - referenced:
+        try:
+            modified = default_storage.get_modified_time(name)
+        except (FileNotFoundError, NotADirectoryError):
+            # a placeholder, or released already; renditions left
+            # without their file go too
+            delete_renditions(name)
+            continue
+        if modified < now - grace:
+            default_storage.delete(name)
+            delete_renditions(name)
+            removed += 1
+        else:
+            pending[name] = modified
+
+    if pending:
+        delay = (max(pending.values()) + grace - now).total_seconds() + 1
+        submit_later(delay, release_thumbnails, list(pending), grace)
+
+    return removed
+
+
+# the files under `directory` that have renditions but are gone
+def orphaned_sources(directory):
+    seen = set()
+    for rendition in walk_storage(RENDITIONS_DIR + '/' + directory):
+        name = source_name(rendition)
+        if name not in seen:
+            seen.add(name)
+            if not default_storage.exists(name):
+                yield name
+
+
+# Removes files under `directory` that no project references anymore,
+# including ones left behind by failed uploads, and renditions whose
+# file is gone.
+def sweep_thumbnails(directory='images', grace=timedelta(minutes=10), batch_size=500):
+    removed = 0
+
+    batch = []
+    for name in itertools.chain(walk_storage(directory), orphaned_sources(directory)):
+        batch.append(name)
+        if len(batch) == batch_size:
+            removed += release_thumbnails(batch, grace)
+            batch = []
+    if batch:
+        removed += release_thumbnails(batch, grace)
+
+    logger.info("thumbnail sweep removed %d file(s)", removed)
+    return removed
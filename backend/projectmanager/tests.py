@@ -1,3 +1,1069 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.urls import clear_url_caches
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import Throttled
+from rest_framework.renderers import JSONRenderer
+
+from . import authentication, credentials, db, hashing, routers, throttling
+from .tasks import release_thumbnails, sweep_thumbnails
+from .benchmarks import thumbnail_image
+from .authentication import CachedTokenAuthentication
+from .middleware import ReplicaMiddleware
+from .projectors import project_projector
+from .renderers import FastJSONRenderer
+from .serializers import ProjectSerializer
+from .thumbnails import best_rendition, generate_renditions, rendition_name
+
+from .models import Person, Project, ProjectTombstone
+from .pagination import encode_cursor
+from . import readcache
+
+
+def make_users(count, start=0):
+    for i in range(start, start + count):
+        user = User.objects.create(username='user%d' % i, first_name='User %d' % i,
+                                   email='user%d@example.com' % i)
+        Person.objects.create(user=user, job_title='job %d' % i)
+
+
+class UsersEndpointTests(TestCase):
+
+    def test_response_shape(self):
+        make_users(1)
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+        response = self.client.get('/projectmanager/users/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{
+            "id": User.objects.get(username='user0').id,
+            "first_name": "User 0",
+            "job_title": "job 0",
+            "username": "user0",
+            "email": "user0@example.com",
+        }])
+
+    def test_query_count_does_not_grow_with_users(self):
+        make_users(3)
+        with self.assertNumQueries(1):
+            self.client.get('/projectmanager/users/')
+
+        make_users(30, start=3)
+        with self.assertNumQueries(1):
+            response = self.client.get('/projectmanager/users/')
+        self.assertEqual(len(response.json()), 33)
+
+    def test_pagination(self):
+        make_users(5)
+
+        response = self.client.get('/projectmanager/users/?limit=2')
+        self.assertEqual([u['username'] for u in response.json()], ['user0', 'user1'])
+
+        response = self.client.get('/projectmanager/users/?limit=3&cursor=' + response['X-Next-Cursor'])
+        self.assertEqual([u['username'] for u in response.json()], ['user2', 'user3', 'user4'])
+        self.assertFalse(response.has_header('Link'))
+
+    def test_malformed_cursor(self):
+        make_users(1)
+        Project.objects.create(user=User.objects.get(), title='p')
+
+        for values in (['garbage', 1], [1, 2], [{}, 2], [None, None], ['2020-01-01T00:00:00Z', 'x']):
+            cursor = encode_cursor(values)
+            for path, params in (('/projectmanager/projects/', {}), ('/projectmanager/profile/', {'username': 'user0'})):
+                response = self.client.get(path, dict(params, cursor=cursor))
+                self.assertEqual(response.json(), {"error": "invalid cursor"}, (path, values))
+
+        for values in (['garbage'], [{}], [None], [[1]]):
+            response = self.client.get('/projectmanager/users/', {'cursor': encode_cursor(values)})
+            self.assertEqual(response.status_code, 400, values)
+            self.assertEqual(response.json(), {"error": "invalid cursor"})
+
+
+class ProjectListingTests(TestCase):
+
+    def setUp(self):
+        make_users(1)
+        user = User.objects.get()
+        day = timezone.now() - timedelta(days=10)
+        # created on: a -> day 2, b -> day 1, c -> day 2, d and e unknown
+        for title, created in (('a', day + timedelta(days=2)), ('b', day + timedelta(days=1)),
+                               ('d', None), ('c', day + timedelta(days=2)), ('e', None)):
+            project = Project.objects.create(user=user, title=title, long_description='l' + title)
+            Project.objects.filter(pk=project.pk).update(date_created=created)
+        self.order = ['b', 'a', 'c', 'd', 'e']
+
+    def test_next_links_walk_every_project_once(self):
+        titles = []
+        url = '/projectmanager/projects/?limit=2&fields=title'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            titles += [project['title'] for project in response.json()]
+            link = response.get('Link')
+            url = link and re.match(r'^<http://testserver(.*)>; rel="next"$', link).group(1)
+
+        # oldest first, ties by id, unknown creation dates (NULLS LAST) at the end
+        self.assertEqual(titles, self.order)
+
+    def test_fields(self):
+        response = self.client.get('/projectmanager/projects/?fields=title, long_description&limit=1')
+        self.assertEqual(response.json(), [{"title": "b", "long_description": "lb"}])
+
+        response = self.client.get('/projectmanager/projects/?limit=1')
+        self.assertEqual(set(response.json()[0]), set(ProjectSerializer.Meta.fields))
+
+        for query, error in (('fields=title,password,search_vector', "unknown field(s): password, search_vector"),
+                             ('limit=0', "limit must be positive"), ('limit=ten', "limit must be an integer")):
+            response = self.client.get('/projectmanager/projects/?' + query)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"error": error})
+
+    def test_stream_ndjson(self):
+        response = self.client.get('/projectmanager/projects/?stream=ndjson&fields=title&limit=1')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"title": title} for title in self.order])
+
+
+class TokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        caches['tokens'].clear()
+        self.user = User.objects.create_user('owner', password='secret')
+        Person.objects.create(user=self.user, job_title='tester')
+
+    def log_in(self):
+        response = self.client.post('/projectmanager/log_in/', {'username': 'owner', 'password': 'secret'})
+        self.assertEqual(response.json()['job_title'], 'tester')
+        return response.json()['token']
+
+    def test_resolved_from_cache(self):
+        key = self.log_in()
+        with self.assertNumQueries(0):
+            user, token = CachedTokenAuthentication().authenticate_credentials(key)
+        self.assertEqual((user.pk, user.person.job_title), (self.user.pk, 'tester'))
+
+    def test_password_hash_not_cached(self):
+        key = self.log_in()
+        self.assertEqual(caches['tokens'].get(authentication.token_key(key))[0], self.user.pk)
+        cached_user = caches['tokens'].get(authentication.user_key(self.user.pk))
+        self.assertNotIn('password', cached_user.__dict__)
+
+        caches['tokens'].clear()
+        user, token = CachedTokenAuthentication().authenticate_credentials(key)
+        self.assertNotIn('password', caches['tokens'].get(authentication.user_key(self.user.pk)).__dict__)
+        self.assertTrue(user.check_password('secret'))
+
+    def test_person_change_drops_only_the_user_entry(self):
+        key = self.log_in()
+        person = Person.objects.get(user=self.user)
+        person.job_title = 'changed'
+        with self.assertNumQueries(1):
+            person.save()
+
+        user, token = CachedTokenAuthentication().authenticate_credentials(key)
+        self.assertEqual(user.person.job_title, 'changed')
+
+    def test_log_out_revokes(self):
+        key = self.log_in()
+        response = self.client.delete('/projectmanager/log_out/', HTTP_AUTHORIZATION='Token ' + key)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.delete('/projectmanager/log_out/', HTTP_AUTHORIZATION='Token ' + key)
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(TOKEN_TTL=60)
+    def test_expired_token_rotated(self):
+        key = self.log_in()
+        Token.objects.filter(key=key).update(created=Token.objects.get(key=key).created - timedelta(minutes=2))
+        caches['tokens'].clear()
+
+        response = self.client.delete('/projectmanager/log_out/', HTTP_AUTHORIZATION='Token ' + key)
+        self.assertEqual(response.status_code, 401)
+        self.assertNotEqual(self.log_in(), key)
+
+
+class CredentialCacheTests(TestCase):
+
+    def test_log_out_orphans_cached_credentials(self):
+        cache.clear()
+        user = User.objects.create_user('owner', password='secret')
+        check = mock.patch('projectmanager.credentials.authenticate', wraps=credentials.authenticate)
+
+        with check as authenticate:
+            self.assertEqual(credentials.cached_authenticate('owner', 'secret'), user)
+            self.assertEqual(credentials.cached_authenticate('owner', 'secret'), user)
+            self.assertEqual(authenticate.call_count, 1)
+
+            # the generation lives in the database, clearing the cache
+            # (or evicting from it) can't undo the log out
+            credentials.forget_credentials(user)
+            self.assertEqual(credentials.cached_authenticate('owner', 'secret'), user)
+            self.assertEqual(authenticate.call_count, 2)
+            self.assertEqual(Person.objects.get(user=user).credentials_generation, 1)
+
+
+class HashingPoolTests(TestCase):
+
+    def test_saturated_pool_turns_signups_away(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with mock.patch.object(hashing, '_slots', slots):
+            response = self.client.post('/projectmanager/create_account/', {
+                'first_name': 'New', 'job_title': 'tester', 'username': 'new',
+                'email': 'new@example.com', 'password': 'secret'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(hashing.RETRY_AFTER))
+        self.assertFalse(User.objects.filter(username='new').exists())
+
+    def test_log_in_upgrades_hash(self):
+        user = User.objects.create_user('owner', password='secret')
+        Person.objects.create(user=user)
+
+        with override_settings(PASSWORD_HASHERS=['projectmanager.hashing.ScryptPasswordHasher',
+                                                 'django.contrib.auth.hashers.PBKDF2PasswordHasher']):
+            response = self.client.post('/projectmanager/log_in/', {'username': 'owner', 'password': 'secret'})
+
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+
+
+class ReadCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='owner')
+        self.project = Project.objects.create(user=self.user, title='cached',
+                                              long_description='old', contributions='c')
+
+    def test_hit_and_invalidation_on_save(self):
+        hits = readcache.get_stats()['hits']
+        self.client.get('/projectmanager/view_project/', {'title': 'cached'})
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/projectmanager/view_project/', {'title': 'cached'})
+        self.assertEqual(response.json()['long_description'], 'old')
+        self.assertEqual(readcache.get_stats()['hits'], hits + 1)
+
+        self.project.long_description = 'new'
+        self.project.save()
+
+        response = self.client.get('/projectmanager/view_project/', {'title': 'cached'})
+        self.assertEqual(response.json()['long_description'], 'new')
+
+    def test_filled_from_the_primary(self):
+        token = routers.current_replica.set('replica1')
+        try:
+            self.assertIsNone(readcache.cached('replica-test', routers.current_replica.get))
+            self.assertEqual(routers.current_replica.get(), 'replica1')
+        finally:
+            routers.current_replica.reset(token)
+
+    def test_profile_invalidated_by_new_project(self):
+        self.client.get('/projectmanager/profile/', {'username': 'owner'})
+        Project.objects.create(user=self.user, title='second')
+
+        response = self.client.get('/projectmanager/profile/', {'username': 'owner'})
+        self.assertEqual([p['title'] for p in response.json()], ['cached', 'second'])
+
+    def test_profile_pages_invalidated(self):
+        Project.objects.create(user=self.user, title='second')
+        first = self.client.get('/projectmanager/profile/', {'username': 'owner', 'limit': 1})
+        self.assertEqual([p['title'] for p in first.json()], ['cached'])
+
+        cursor = first['X-Next-Cursor']
+        self.client.get('/projectmanager/profile/', {'username': 'owner', 'limit': 1, 'cursor': cursor})
+        Project.objects.filter(title='second').update(short_description='changed')
+        Project.objects.get(title='second').save()
+
+        response = self.client.get('/projectmanager/profile/', {'username': 'owner', 'limit': 1, 'cursor': cursor})
+        self.assertEqual(response.json()[0]['short_description'], 'changed')
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+    def test_profile_matches_model_rendering(self):
+        Project.objects.create(user=self.user, title='empty', thumbnail='')
+        Project.objects.create(user=self.user, title='with thumbnail', thumbnail='images/a.png')
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/projectmanager/profile/', {'username': 'owner'})
+        with self.assertNumQueries(0):
+            self.client.get('/projectmanager/profile/', {'username': 'owner'})
+
+        expected = [{"id": project.id, "thumbnail": "/media/" + str(project.thumbnail), "title": project.title,
+                     "short_description": project.short_description}
+                    for project in Project.objects.filter(user=self.user).order_by('date_created', 'id')]
+        self.assertEqual(response.json(), expected)
+        self.assertEqual([p['thumbnail'] for p in expected], ['/media/', '/media/', '/media/images/a.png'])
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        Project.objects.create(title='Garden planner', short_description='plan a vegetable garden')
+        Project.objects.create(title='Recipe box', long_description='recipes from the garden')
+        Project.objects.create(title='Chess clock', contributions='timer')
+
+    def test_ranked_results(self):
+        response = self.client.get('/projectmanager/search/', {'q': 'garden', 'fields': 'title'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'title': 'Garden planner'}, {'title': 'Recipe box'}])
+
+    def test_index_follows_updates_and_deletes(self):
+        project = Project.objects.get(title='Chess clock')
+        project.contributions = 'garden timer'
+        project.save()
+        Project.objects.filter(title='Recipe box').delete()
+
+        response = self.client.get('/projectmanager/search/', {'q': 'garden', 'fields': 'title'})
+        self.assertEqual([p['title'] for p in response.json()], ['Garden planner', 'Chess clock'])
+
+    def test_pagination(self):
+        response = self.client.get('/projectmanager/search/', {'q': 'garden', 'limit': 1})
+        self.assertEqual(len(response.json()), 1)
+        self.assertIn('page=2', response['Link'])
+
+        response = self.client.get('/projectmanager/search/', {'q': 'garden', 'limit': 1, 'page': 2})
+        self.assertFalse(response.has_header('Link'))
+
+
+class BatchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner', password='secret')
+        Project.objects.create(user=self.user, title='existing', contributions='old')
+
+    def post(self, operations):
+        body = {'username': 'owner', 'password': 'secret', 'operations': operations}
+        return self.client.post('/projectmanager/batch/', body, content_type='application/json')
+
+    def test_partial_failure(self):
+        fields = {'long_description': 'l', 'short_description': 's', 'contributions': 'c'}
+        response = self.post([
+            dict(op='create', title='new', **fields),
+            dict(op='create', title='incomplete'),
+            dict(op='update', title='existing', contributions='new'),
+            dict(op='delete', title='missing'),
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json()['results']], [201, 400, 202, 404])
+        self.assertEqual(Project.objects.get(title='existing').contributions, 'new')
+        self.assertTrue(Project.objects.filter(title='new', user=self.user).exists())
+        self.assertFalse(Project.objects.filter(title='incomplete').exists())
+
+    def test_only_owner_may_delete(self):
+        other = User.objects.create_user('other', password='secret')
+        Project.objects.create(user=other, title='theirs')
+
+        response = self.post([dict(op='delete', title='theirs'), dict(op='delete', title='existing')])
+
+        self.assertEqual([r['status'] for r in response.json()['results']], [401, 200])
+        self.assertEqual(list(Project.objects.values_list('title', flat=True)), ['theirs'])
+
+    @override_settings(BATCH_MAX_OPERATIONS=2)
+    def test_ndjson_read_up_to_the_limit(self):
+        token = Token.objects.create(user=self.user)
+        lines = [b'{"op": "delete", "title": "existing"}'] * 3 + [b'not json']
+
+        response = self.client.post('/projectmanager/batch/', b'\n'.join(lines), content_type='application/x-ndjson',
+                                    HTTP_AUTHORIZATION='Token ' + token.key)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "at most 2 documents per request"})
+        self.assertTrue(Project.objects.filter(title='existing').exists())
+
+
+class DuplicateTitleTests(TestCase):
+
+    FIELDS = {'long_description': 'l', 'short_description': 's', 'contributions': 'c'}
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='secret')
+        Project.objects.create(user=self.owner, title='taken', **self.FIELDS)
+
+    def post(self, path, **data):
+        return self.client.post(path, dict(username='owner', password='secret', **data))
+
+    def test_create_conflicts(self):
+        response = self.post('/projectmanager/create/', title='taken', **self.FIELDS)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {"error":"project with that title already exists"})
+        self.assertEqual(Project.objects.filter(title='taken').count(), 1)
+        # the failed insert didn't break the request's transaction
+        self.assertEqual(self.post('/projectmanager/create/', title='free', **self.FIELDS).status_code, 201)
+
+    def test_update_looks_the_title_up(self):
+        response = self.post('/projectmanager/update/', title='taken', contributions='new')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Project.objects.get(title='taken').contributions, 'new')
+
+    def test_batch_conflicts_as_a_whole(self):
+        with mock.patch('projectmanager.views.run_batch', side_effect=IntegrityError):
+            response = self.client.post('/projectmanager/batch/', {
+                'username': 'owner', 'password': 'secret',
+                'operations': [dict(op='create', title='free', **self.FIELDS)]}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 409)
+
+
+class DedupeTitlesMigrationTests(TransactionTestCase):
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('projectmanager', target)])
+        return executor.loader.project_state([('projectmanager', target)]).apps
+
+    def test_duplicates_renamed_oldest_kept(self):
+        apps = self.migrate('0002_project_created_id_idx')
+        self.addCleanup(self.migrate, MigrationLoader(connection).graph.leaf_nodes('projectmanager')[0][1])
+        User = apps.get_model('auth', 'User')
+        Project = apps.get_model('projectmanager', 'Project')
+        user = User.objects.create(username='owner')
+        first, second, third = [Project.objects.create(user=user, title='dup') for _ in range(3)]
+        # a project really called like the suffix the second one would get
+        Project.objects.create(user=user, title='dup-%d' % second.id)
+
+        apps = self.migrate('0003_dedupe_project_titles')
+
+        titles = dict(apps.get_model('projectmanager', 'Project').objects.values_list('id', 'title'))
+        self.assertEqual(titles[first.id], 'dup')
+        self.assertEqual(titles[second.id], 'dup-%d-2' % second.id)
+        self.assertEqual(titles[third.id], 'dup-%d' % third.id)
+
+
+@mock.patch('projectmanager.views.submit')
+@mock.patch('projectmanager.changes.submit')
+class BulkDeleteTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.created = 0
+
+    def fill(self, count):
+        make_users(count, start=self.created)
+        for i in range(self.created, self.created + count):
+            user = User.objects.get(username='user%d' % i)
+            Project.objects.create(user=user, title='by %s' % user.username)
+            Token.objects.create(user=user)
+        self.created += count
+
+    def delete(self, path):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(path, {'username': 'admin', 'password': 'secret'},
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['deleted'], len(queries)
+
+    def test_delete_all_projects(self, *submits):
+        self.fill(2)
+        small, queries = self.delete('/projectmanager/delete_all_projects/')
+        self.fill(20)
+        readcache.get_project('by user10')
+        large, more_queries = self.delete('/projectmanager/delete_all_projects/')
+
+        self.assertEqual((small, large), ({'projects': 2}, {'projects': 20}))
+        self.assertEqual(more_queries, queries)
+        self.assertEqual(ProjectTombstone.objects.count(), 22)
+        with self.assertRaises(Http404):
+            readcache.get_project('by user10')
+
+    def test_flush_database(self, *submits):
+        self.fill(2)
+        small, queries = self.delete('/projectmanager/flush_database/')
+        self.fill(20)
+        large, more_queries = self.delete('/projectmanager/flush_database/')
+
+        self.assertEqual(small, {'projects': 2, 'users': 2, 'persons': 2})
+        self.assertEqual(large, {'projects': 20, 'users': 20, 'persons': 20})
+        self.assertEqual(more_queries, queries)
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['admin'])
+        self.assertFalse(Token.objects.exists())
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class ChangesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner', password='secret')
+        for title in ('first', 'second', 'third'):
+            Project.objects.create(user=self.user, title=title)
+
+    def test_incremental_sync(self):
+        response = self.client.get('/projectmanager/changes/', {'limit': 2})
+        self.assertEqual([c['title'] for c in response.json()], ['first', 'second'])
+        self.assertTrue(response.has_header('Link'))
+
+        response = self.client.get('/projectmanager/changes/', {'since': response['X-Next-Cursor']})
+        self.assertEqual([c['title'] for c in response.json()], ['third'])
+        cursor = response['X-Next-Cursor']
+
+        project = Project.objects.get(title='first')
+        project.contributions = 'more'
+        project.save()
+        self.client.post('/projectmanager/delete_project/', {'username': 'owner', 'password': 'secret', 'title': 'second'})
+
+        response = self.client.get('/projectmanager/changes/', {'since': cursor})
+        self.assertEqual([(c['change'], c['title']) for c in response.json()],
+                         [('updated', 'first'), ('deleted', 'second')])
+        self.assertEqual(response.json()[1]['project'], None)
+
+
+class RenderingTests(TestCase):
+
+    def test_fast_renderer_matches_drf(self):
+        data = {'text': 'caf\u00e9 \u2028 "quoted"', 'when': timezone.now(), 'price': Decimal('1.50'),
+                'lazy': gettext_lazy('Not found.'), 'nested': [1, 2.5, None, True], 1: 'int key'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @override_settings(COMPRESSION_MIN_SIZE=1024)
+    def test_compressed_when_accepted_and_large(self):
+        for i in range(20):
+            Project.objects.create(title='project %d' % i, long_description='words ' * 50)
+
+        plain = self.client.get('/projectmanager/projects/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        response = self.client.get('/projectmanager/projects/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+        small = self.client.get('/projectmanager/users/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+    def test_listing_revalidated_by_etag_only(self):
+        first = Project.objects.create(title='first')
+        Project.objects.create(title='second')
+
+        response = self.client.get('/projectmanager/projects/')
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/projectmanager/projects/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # deleting a row other than the newest must not keep the old ETag
+        first.delete()
+        self.assertEqual(self.client.get('/projectmanager/projects/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# projectmanager/urls.py picks the async views when it is imported
+def reload_urls():
+    import MyShelf.urls
+    from . import urls
+    importlib.reload(urls)
+    importlib.reload(MyShelf.urls)
+    clear_url_caches()
+
+
+class AsyncReadViewTests(TestCase):
+
+    PATHS = (
+        '/projectmanager/projects/?limit=1',
+        '/projectmanager/projects/?fields=title,user',
+        '/projectmanager/projects/?fields=password',
+        '/projectmanager/projects/?limit=x',
+        '/projectmanager/view_project/?title=alpha',
+        '/projectmanager/view_project/?title=missing',
+        '/projectmanager/view_project/?title=alpha&extra=1',
+        '/projectmanager/get_thumbnail/?title=alpha',
+        '/projectmanager/get_thumbnail/?title=alpha&size=200',
+        '/projectmanager/get_thumbnail/?title=alpha&size=x',
+        '/projectmanager/get_thumbnail/?size=200',
+        '/projectmanager/profile/?username=user0&limit=1',
+        '/projectmanager/profile/?username=nobody',
+        '/projectmanager/profile/?username=user0&bogus=1',
+    )
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        make_users(1)
+        self.thumbnail = default_storage.save('images/alpha.png', ContentFile(thumbnail_image()))
+        generate_renditions(self.thumbnail)
+        user = User.objects.get(username='user0')
+        Project.objects.create(user=user, title='alpha', thumbnail=self.thumbnail,
+                               long_description='l', short_description='s', contributions='c')
+        Project.objects.create(user=user, title='beta')
+
+    def enable_async_views(self):
+        async_settings = override_settings(ASYNC_READ_VIEWS=True)
+        async_settings.enable()
+        reload_urls()
+        self.addCleanup(reload_urls)
+        self.addCleanup(async_settings.disable)
+
+    async def test_same_responses_as_drf_views(self):
+        get = sync_to_async(self.client.get)
+        expected = [await get(path) for path in self.PATHS]
+        self.enable_async_views()
+
+        for path, drf in zip(self.PATHS, expected):
+            response = await self.async_client.get(path)
+            with self.subTest(path=path):
+                self.assertEqual(response.status_code, drf.status_code)
+                self.assertEqual(response.json(), drf.json())
+                for header in ('ETag', 'Link', 'X-Next-Cursor'):
+                    self.assertEqual(response.get(header), drf.get(header))
+
+        response = await self.async_client.get('/projectmanager/get_thumbnail/?title=alpha&size=200')
+        self.assertEqual(response.json(), {"thumbnail":"/media/" + rendition_name(self.thumbnail, 256)})
+
+    async def test_not_modified(self):
+        self.enable_async_views()
+        for path in ('/projectmanager/projects/', '/projectmanager/view_project/?title=alpha',
+                     '/projectmanager/profile/?username=user0'):
+            etag = (await self.async_client.get(path))['ETag']
+            # Django 4.0's AsyncClient takes extra headers by their HTTP name
+            response = await self.async_client.get(path, **{'If-None-Match': etag})
+            with self.subTest(path=path):
+                self.assertEqual(response.status_code, 304)
+
+    async def test_ndjson_export_stays_on_wsgi(self):
+        self.enable_async_views()
+        response = await self.async_client.get('/projectmanager/projects/?stream=ndjson')
+        self.assertEqual(response.status_code, 400)
+
+
+class ProjectorTests(TestCase):
+
+    def test_same_output_as_project_serializer(self):
+        make_users(1)
+        Project.objects.create(user=User.objects.get(), title='with thumbnail', thumbnail='images/a b.png',
+                               long_description='l\u00e9ng', contributions='c')
+        Project.objects.create(title='bare')
+        projects = Project.objects.order_by('id')
+
+        renderer = JSONRenderer()
+        for fields in (ProjectSerializer.Meta.fields, ['title', 'id', 'date_created'], ['thumbnail']):
+            projector = project_projector.only(fields)
+            rows, _ = projector.values(projects)
+            self.assertEqual(renderer.render(projector.project_all(rows)),
+                             renderer.render(ProjectSerializer(projects, many=True, fields=fields).data))
+
+
+class ThumbnailStorageTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.media_root = media_root.name
+        User.objects.create_user('owner', password='secret')
+
+    def create(self, title, filename):
+        upload = SimpleUploadedFile(filename, thumbnail_image(), content_type='image/png')
+        with mock.patch('projectmanager.views.submit'):
+            response = self.client.post('/projectmanager/create/', {
+                'username': 'owner', 'password': 'secret', 'title': title, 'thumbnail': upload,
+                'long_description': 'l', 'short_description': 's', 'contributions': 'c'})
+        self.assertEqual(response.status_code, 201)
+        return Project.objects.get(title=title).thumbnail.name
+
+    def test_identical_uploads_share_one_file_until_the_last_project_goes(self):
+        first = self.create('first', 'cat.png')
+        second = self.create('second', 'other name.PNG')
+
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^images/[0-9a-f]{64}\.png$')
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'images')), [os.path.basename(first)])
+
+        Project.objects.filter(title='first').delete()
+        self.assertEqual(release_thumbnails([first], grace=timedelta(0)), 0)
+        Project.objects.filter(title='second').delete()
+        self.assertEqual(release_thumbnails([first], grace=timedelta(0)), 1)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'images')), [])
+
+    def test_released_again_after_the_grace(self):
+        name = self.create('first', 'cat.png')
+        Project.objects.filter(title='first').delete()
+
+        with mock.patch('projectmanager.tasks.submit_later') as submit_later:
+            self.assertEqual(release_thumbnails([name]), 0)
+        delay, retry, names, grace = submit_later.call_args.args
+        self.assertTrue(600 < delay <= 601)
+        self.assertEqual((retry, names), (release_thumbnails, [name]))
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=delay)):
+            self.assertEqual(retry(names, grace), 1)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_sweep_takes_renditions_left_without_their_file(self):
+        kept, gone = self.create('kept', 'cat.png'), default_storage.save('images/gone.png', ContentFile(b'gone'))
+        for name in (kept, gone):
+            default_storage.save_rendition(rendition_name(name, 128), ContentFile(b'rendition'))
+        default_storage.delete(gone)
+
+        self.assertEqual(sweep_thumbnails(grace=timedelta(0)), 0)
+        self.assertTrue(default_storage.exists(rendition_name(kept, 128)))
+        self.assertFalse(default_storage.exists(rendition_name(gone, 128)))
+
+    def test_hashed_looking_names_are_hashed_too(self):
+        forged = 'images/%s.png' % ('0' * 64)
+        name = default_storage.save(forged, ContentFile(b'not what the name says'))
+        self.assertNotEqual(name, forged)
+        self.assertRegex(name, r'^images/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.create('forged', '0' * 64 + '.png'), self.create('honest', 'cat.png'))
+
+
+class RenditionTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name, THUMBNAIL_SIZES=(128, 256, 512))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.name = default_storage.save('images/cat.png', ContentFile(thumbnail_image()))
+
+    def test_generated_sizes(self):
+        generate_renditions(self.name)
+
+        for size in (128, 256, 512):
+            with default_storage.open(rendition_name(self.name, size)) as f:
+                image = Image.open(f)
+                # 640x480 fitted into size x size
+                self.assertEqual((image.format, image.size), ('WEBP', (size, size * 3 // 4)))
+
+    def test_best_rendition(self):
+        self.assertIsNone(best_rendition(self.name, 200))
+
+        generate_renditions(self.name)
+        for size, expected in ((1, 128), (128, 128), (200, 256), (1000, 512)):
+            self.assertEqual(best_rendition(self.name, size), rendition_name(self.name, expected))
+
+        # the next larger one that exists, else the largest smaller one
+        default_storage.delete(rendition_name(self.name, 256))
+        self.assertEqual(best_rendition(self.name, 200), rendition_name(self.name, 512))
+        default_storage.delete(rendition_name(self.name, 512))
+        self.assertEqual(best_rendition(self.name, 200), rendition_name(self.name, 128))
+
+    def test_size_parameter(self):
+        Project.objects.create(title='cat', thumbnail=self.name)
+        get = lambda query: self.client.get('/projectmanager/get_thumbnail/?title=cat' + query)
+
+        # the original until the renditions are there
+        self.assertEqual(get('&size=200').json(), {"thumbnail":"/media/" + self.name})
+        generate_renditions(self.name)
+        self.assertEqual(get('&size=200').json(), {"thumbnail":"/media/" + rendition_name(self.name, 256)})
+        self.assertEqual(get('').json(), {"thumbnail":"/media/" + self.name})
+        self.assertEqual(get('&size=big').status_code, 400)
+
+
+class ServeMediaTests(TestCase):
+
+    CONTENT = bytes(range(256)) * 4
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.media_root = media_root.name
+
+        self.hashed = 'images/%s.png' % ('a' * 64)
+        for name in (self.hashed, 'images/plain.png'):
+            os.makedirs(os.path.dirname(os.path.join(self.media_root, name)), exist_ok=True)
+            with open(os.path.join(self.media_root, name), 'wb') as f:
+                f.write(self.CONTENT)
+
+    def get(self, name, **headers):
+        return self.client.get('/media/' + name, **headers)
+
+    def test_whole_file(self):
+        response = self.get(self.hashed)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.get('images/plain.png')['Cache-Control'], 'public, max-age=0, must-revalidate')
+
+    def test_ranges(self):
+        response = self.get(self.hashed, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+
+        response = self.get(self.hashed, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[-4:])
+        self.assertEqual(response['Content-Range'], 'bytes 1020-1023/1024')
+
+        response = self.get(self.hashed, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+        # several ranges get the whole file
+        self.assertEqual(self.get(self.hashed, HTTP_RANGE='bytes=0-1,4-5').status_code, 200)
+
+    def test_not_modified_and_missing(self):
+        last_modified = self.get(self.hashed)['Last-Modified']
+        self.assertEqual(self.get(self.hashed, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.get('images/missing.png').status_code, 404)
+        self.assertEqual(self.get('images').status_code, 404)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        response = self.get(self.hashed)
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.hashed)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    @override_settings(MEDIA_SERVE_MODE='x-sendfile')
+    def test_x_sendfile(self):
+        response = self.get('images/plain.png')
+
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, 'images', 'plain.png'))
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+
+class MetricsTests(TestCase):
+
+    def metric(self, line):
+        for found in self.client.get('/metrics').content.decode().splitlines():
+            if found.startswith(line + ' '):
+                return float(found.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_server_timing_and_histograms(self):
+        make_users(3)
+        endpoint = 'endpoint="projectmanager/users/"'
+        before = [self.metric('projectmanager_request_seconds_count{%s}' % endpoint),
+                  self.metric('projectmanager_db_queries_sum{%s}' % endpoint)]
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/projectmanager/users/')
+        # the next request resets the connection's query log
+        queries = len(captured)
+        self.assertGreater(queries, 0)
+
+        self.assertRegex(response['Server-Timing'],
+                         r'^total;dur=[0-9.]+, db;dur=[0-9.]+;desc="%d queries"$' % queries)
+        self.assertEqual(self.metric('projectmanager_request_seconds_count{%s}' % endpoint), before[0] + 1)
+        self.assertEqual(self.metric('projectmanager_db_queries_sum{%s}' % endpoint), before[1] + queries)
+        self.assertEqual(self.metric('projectmanager_request_seconds_bucket{%s,le="+Inf"}' % endpoint), before[0] + 1)
+        self.assertGreater(self.metric('projectmanager_response_bytes_sum{%s}' % endpoint), 0)
+
+    def test_credential_checks_timed(self):
+        User.objects.create_user('owner', password='secret')
+        Project.objects.create(title='mine', user=User.objects.get(username='owner'))
+
+        response = self.client.post('/projectmanager/update/', {
+            'username': 'owner', 'password': 'secret', 'title': 'mine', 'contributions': 'c'})
+
+        self.assertRegex(response['Server-Timing'], r', auth;dur=[0-9.]+')
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled(self):
+        self.assertFalse(self.client.get('/projectmanager/users/').has_header('Server-Timing'))
+
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        throttling.reset()
+        self.addCleanup(throttling.reset)
+        Person.objects.create(user=User.objects.create_user('owner', password='secret'))
+
+    def test_log_in_bucket_runs_out(self):
+        rates = {'auth': '2/minute', 'write': '120/minute', 'admin': '6/minute'}
+        with override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            statuses = [self.client.post('/projectmanager/log_in/', {'username': 'owner', 'password': 'secret'})
+                        for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in statuses], [200, 200, 429])
+        self.assertEqual(statuses[-1]['Retry-After'], '30')
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('projectmanager_throttle_total{scope="auth",outcome="throttled"} 1', metrics)
+
+    def test_spoofed_forwarded_for_shares_a_bucket(self):
+        rates = {'auth': '2/minute', 'write': '120/minute', 'admin': '6/minute'}
+        with override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates)):
+            # the router appends the address it saw to what the client sent
+            statuses = [self.client.post('/projectmanager/log_in/', {'username': 'owner', 'password': 'secret'},
+                                         HTTP_X_FORWARDED_FOR='10.0.0.%d, 203.0.113.7' % i).status_code
+                        for i in range(3)]
+
+        self.assertEqual(statuses, [200, 200, 429])
+
+    @override_settings(THROTTLE_MAX_CLIENTS=2)
+    def test_least_recently_used_bucket_dropped(self):
+        for key in ('a', 'b', 'a', 'c'):
+            throttling._take(key, 5, 60)
+        self.assertEqual(list(throttling._buckets), ['a', 'c'])
+
+    @override_settings(THROTTLE_CONCURRENCY={'admin': 1})
+    def test_concurrency_limit_sheds_load(self):
+        scope = throttling.admit('admin')
+        with self.assertRaises(Throttled):
+            throttling.admit('admin')
+        throttling.release(scope)
+        throttling.release(throttling.admit('admin'))
+        self.assertEqual(throttling.get_stats(), ({('admin', 'shed'): 1}, {'admin': 0}))
+
+
+class TransferTests(TestCase):
+
+    def test_export_import_round_trip(self):
+        make_users(2)
+        user = User.objects.get(username='user1')
+        Project.objects.create(user=user, title='first', long_description='l\u00e9ng', contributions='c')
+        Project.objects.create(title='orphan', short_description='s')
+        projects = list(Project.objects.order_by('title').values_list('title', 'user__username', 'long_description',
+                                                                      'short_description', 'date_created'))
+
+        directory = tempfile.mkdtemp()
+        for model, name in (('users', 'users.ndjson'), ('projects', 'projects.csv')):
+            call_command('export_projects', os.path.join(directory, name), model=model, stderr=open(os.devnull, 'w'))
+
+        User.objects.all().delete()
+        for model, name in (('users', 'users.ndjson'), ('projects', 'projects.csv')):
+            call_command('import_projects', os.path.join(directory, name), model=model, workers=1,
+                         stderr=open(os.devnull, 'w'))
+
+        self.assertEqual(Person.objects.get(user__username='user1').job_title, 'job 1')
+        self.assertEqual(list(Project.objects.order_by('title').values_list(
+            'title', 'user__username', 'long_description', 'short_description', 'date_created')), projects)
+
+    def test_import_drops_cached_misses(self):
+        cache.clear()
+        with self.assertRaises(Http404):
+            readcache.get_project('imported')
+
+        path = os.path.join(tempfile.mkdtemp(), 'projects.ndjson')
+        with open(path, 'w') as f:
+            f.write('{"title": "imported", "long_description": "l", "date_created": "2020-01-02T03:04:05Z"}\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_projects', path, workers=1, stderr=open(os.devnull, 'w'))
+
+        self.assertEqual(readcache.get_project('imported')['long_description'], 'l')
+        self.assertEqual(Project.objects.get(title='imported').date_created.year, 2020)
+
+
+class StaleConnection:
+
+    settings_dict = {'CONN_HEALTH_CHECKS': True}
+
+    def __init__(self):
+        self.connection = object()
+        self.pings = 0
+
+    def is_usable(self):
+        self.pings += 1
+        return False
+
+    def close(self):
+        self.connection = None
+
+    def ensure_connection(self):
+        if self.connection is None:
+            self.connection = object()
+
+
+class ConnectionHealthCheckTests(SimpleTestCase):
+
+    def test_checked_on_first_use_only(self):
+        primary, replica = StaleConnection(), StaleConnection()
+        first = primary.connection
+        for connection in (primary, replica):
+            db.install_health_check(connection)
+
+        with mock.patch('projectmanager.db.connections') as connections:
+            connections.all.return_value = [primary, replica]
+            db.check_connections()
+        self.assertEqual((primary.pings, replica.pings), (0, 0))
+
+        primary.ensure_connection()
+        primary.ensure_connection()
+        self.assertEqual((primary.pings, replica.pings), (1, 0))
+        self.assertIsNot(primary.connection, first)
+
+
+@override_settings(REPLICA_WEIGHTS={'replica1': 2, 'replica2': 1}, REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        routers._replicas = None
+        self.addCleanup(setattr, routers, '_replicas', None)
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+        def view(request):
+            self.read_from = self.router.db_for_read(Project)
+            return HttpResponse(status=self.status)
+
+        self.middleware = ReplicaMiddleware(view)
+        self.status = 200
+
+    def read_from_for(self, request):
+        response = self.middleware(request)
+        return self.read_from, response
+
+    def test_safe_requests_read_from_replicas_by_weight(self):
+        reads = [self.read_from_for(self.factory.get('/projectmanager/projects/'))[0] for _ in range(6)]
+        self.assertEqual(reads, ['replica1', 'replica1', 'replica2'] * 2)
+        self.assertEqual(self.router.db_for_read(Project), 'default')
+        self.assertEqual(self.router.db_for_write(Project), 'default')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        read_from, response = self.read_from_for(self.factory.post('/projectmanager/create/',
+                                                                   HTTP_AUTHORIZATION='Token abc'))
+        self.assertEqual(read_from, 'default')
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], 10)
+
+        request = self.factory.get('/projectmanager/projects/')
+        request.COOKIES[routers.PIN_COOKIE] = '1'
+        self.assertEqual(self.read_from_for(request)[0], 'default')
+        request = self.factory.get('/projectmanager/projects/', HTTP_AUTHORIZATION='Token abc')
+        self.assertEqual(self.read_from_for(request)[0], 'default')
+        request = self.factory.get('/projectmanager/projects/', HTTP_AUTHORIZATION='Token other')
+        self.assertEqual(self.read_from_for(request)[0], 'replica1')
+
+        self.status = 400
+        response = self.read_from_for(self.factory.post('/projectmanager/create/'))[1]
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Per-client rate limits and per-endpoint admission control for the
+# expensive endpoints: the ones that hash passwords (log_in/,
+# create_account/ and the body-authenticated writes) and the ones that
+# can lock tables (delete_all_projects/, flush_database/).
+#
+# BucketThrottle gives every client (the user for token requests, the
+# address otherwise) a token bucket per scope, sized and refilled from
+# the scope's rate in DEFAULT_THROTTLE_RATES ("20/minute" allows bursts
+# of 20, then one request every 3s). Buckets live in the process (the
+# THROTTLE_MAX_CLIENTS most recently used ones, older ones are dropped); with
+# THROTTLE_SHARED and CACHE_URL set the limit is counted in the shared
+# cache instead, per fixed window, so it holds across workers.
+#
+# AdmissionControlMixin lets at most THROTTLE_CONCURRENCY[scope]
+# requests of a scope run at once per process and turns the rest away
+# with a 429 right away instead of letting them queue for a worker.
+#
+# Both answer with 429 and Retry-After; what they let through and turn
+# away is counted per scope and served at /metrics.
+
+# action -> scope; views without an action set `throttle_scope`
+ACTION_SCOPES = {
+    'create_account': 'auth',
+    'create': 'write',
+    'update': 'write',
+    'delete_project': 'write',
+    'batch': 'write',
+    'log_out': 'write',
+    'delete_all_projects': 'admin',
+    'flush_database': 'admin',
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_lock = threading.Lock()
+# least recently used first
+_buckets = OrderedDict()
+_counts = Counter()
+_slots = {}
+_in_flight = Counter()
+
+
+def get_scope(view):
+    return ACTION_SCOPES.get(getattr(view, 'action', None)) or getattr(view, 'throttle_scope', None)
+
+
+# "20/minute" -> (20, 60)
+def parse_rate(rate):
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def _count(scope, outcome):
+    with _lock:
+        _counts[scope, outcome] += 1
+
+
+def get_stats():
+    with _lock:
+        return dict(_counts), dict(_in_flight)
+
+
+# forgets every bucket, counter and concurrency limit; call it while
+# no request is running
+def reset():
+    with _lock:
+        _buckets.clear()
+        _counts.clear()
+        _slots.clear()
+        _in_flight.clear()
+
+
+def _shared():
+    return caches['default'] if settings.THROTTLE_SHARED and settings.CACHE_URL else None
+
+
+# takes a token from the bucket; returns 0 or the seconds until one is
+# available again
+def _take(key, capacity, period):
+    now = time.monotonic()
+    refill = capacity / period
+
+    with _lock:
+        # popped and put back, which moves it to the end
+        tokens, updated = _buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        if tokens >= 1:
+            _buckets[key] = (tokens - 1, now)
+            wait = 0
+        else:
+            _buckets[key] = (tokens, now)
+            wait = (1 - tokens) / refill
+
+        while len(_buckets) > settings.THROTTLE_MAX_CLIENTS:
+            _buckets.popitem(last=False)
+
+    return wait
+
+
+def _take_shared(cache, key, capacity, period):
+    now = time.time()
+    window = int(now // period)
+    key = 'throttle:%s:%d' % (key, window)
+    cache.add(key, 0, period)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # expired between add() and incr()
+        cache.add(key, 1, period)
+        count = 1
+    return 0 if count <= capacity else (window + 1) * period - now
+
+
+class BucketThrottle(BaseThrottle):
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        scope = get_scope(view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if not settings.THROTTLE_ENABLED or rate is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        if request.user is not None and request.user.is_authenticated:
+            client = 'user-%d' % request.user.pk
+        else:
+            client = self.get_ident(request)
+        key = '%s:%s' % (scope, client)
+
+        cache = _shared()
+        if cache is not None:
+            self.wait_seconds = _take_shared(cache, key, capacity, period)
+        else:
+            self.wait_seconds = _take(key, capacity, period)
+
+        _count(scope, 'throttled' if self.wait_seconds else 'allowed')
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def admit(scope):
+    limit = settings.THROTTLE_CONCURRENCY.get(scope)
+    if not settings.THROTTLE_ENABLED or not limit:
+        return None
+
+    with _lock:
+        slots = _slots.get(scope)
+        if slots is None:
+            slots = _slots[scope] = threading.BoundedSemaphore(limit)
+
+    if not slots.acquire(blocking=False):
+        _count(scope, 'shed')
+        raise Throttled(wait=1, detail="server busy, try again later")
+
+    with _lock:
+        _in_flight[scope] += 1
+    return scope
+
+
+def release(scope):
+    with _lock:
+        _in_flight[scope] -= 1
+    _slots[scope].release()
+
+
+class AdmissionControlMixin:
+
+    admitted = None
+
+    # runs after authentication, permissions and throttles
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.admitted = admit(get_scope(self))
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.admitted is not None:
+                release(self.admitted)
+                self.admitted = None
@@ -0,0 +1,79 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+# Uploaded thumbnails are stored as sent; fixed-size renditions are
+# generated from them in the background (see tasks.submit) and stored
+# next to each other under renditions/, e.g. for images/<sha256>.png:
+#   renditions/images/<sha256>.png.128.webp
+#   renditions/images/<sha256>.png.256.webp ...
+RENDITIONS_DIR = 'renditions'
+
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+
+def rendition_name(name, size):
+    _, extension = FORMATS[settings.THUMBNAIL_FORMAT]
+    return '%s/%s.%d.%s' % (RENDITIONS_DIR, name, size, extension)
+
+
+# the file a rendition was made from
+def source_name(rendition):
+    return rendition[len(RENDITIONS_DIR) + 1:].rsplit('.', 2)[0]
+
+
+def generate_renditions(name):
+    pil_format, _ = FORMATS[settings.THUMBNAIL_FORMAT]
+
+    # stored files are content addressed, a file uploaded again already
+    # has its renditions
+    if all(default_storage.exists(rendition_name(name, size)) for size in settings.THUMBNAIL_SIZES):
+        return
+
+    with default_storage.open(name) as f:
+        image = Image.open(f)
+        image.load()
+
+    # JPEG has no alpha channel and neither format takes palettes
+    if image.mode not in ('RGB', 'RGBA') or pil_format == 'JPEG':
+        image = image.convert('RGBA' if pil_format == 'WEBP' else 'RGB')
+
+    for size in settings.THUMBNAIL_SIZES:
+        rendition = image.copy()
+        # fits the image into a size x size box keeping the aspect
+        # ratio, smaller images are never scaled up
+        rendition.thumbnail((size, size), Image.LANCZOS)
+
+        buffer = BytesIO()
+        rendition.save(buffer, pil_format, quality=85)
+
+        target = rendition_name(name, size)
+        default_storage.delete(target)
+        default_storage.save_rendition(target, ContentFile(buffer.getvalue()))
+
+
+def delete_renditions(name):
+    for size in settings.THUMBNAIL_SIZES:
+        default_storage.delete(rendition_name(name, size))
+
+
+# smallest rendition at least `size` pixels wide/high, or the largest
+# one if none is big enough; None if no rendition has been generated
+def best_rendition(name, size):
+    sizes = sorted(settings.THUMBNAIL_SIZES)
+    candidates = [s for s in sizes if s >= size] or sizes[-1:]
+    candidates += [s for s in reversed(sizes) if s not in candidates]
+
+    for candidate in candidates:
+        rendition = rendition_name(name, candidate)
+        if default_storage.exists(rendition):
+            return rendition
+
+    return None
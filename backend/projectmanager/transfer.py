@@ -0,0 +1,300 @@
+import csv
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import readcache
+from .models import Person, Project, update_search_vectors
+
+# Bulk export/import of users (with their Person row) and projects as
+# NDJSON or CSV, used by the export_projects and import_projects
+# management commands. Rows are streamed in batches so memory stays flat
+# whatever the table size. On Postgres, CSV goes through COPY.
+#
+# Users are identified by username and projects by title (both unique),
+# a project refers to its owner by username; ids aren't carried over.
+# Imported projects count as updated at import time (for changes/).
+# Bulk inserts send no signals, so the read cache entries of the
+# imported rows (cached misses included) are dropped explicitly.
+
+USER_FIELDS = ('username', 'first_name', 'last_name', 'email', 'password', 'is_active',
+               'is_staff', 'is_superuser', 'date_joined', 'job_title')
+PROJECT_FIELDS = ('title', 'username', 'long_description', 'short_description', 'contributions',
+                  'thumbnail', 'date_created')
+
+FIELDS = {'users': USER_FIELDS, 'projects': PROJECT_FIELDS}
+
+
+def queryset(model):
+    if model == 'users':
+        return User.objects.order_by('pk').values_list(*USER_FIELDS[:-1], 'person__job_title')
+    return Project.objects.order_by('pk').values_list(*PROJECT_FIELDS[:1], 'user__username', *PROJECT_FIELDS[2:])
+
+
+def use_copy(format):
+    return format == 'csv' and connection.vendor == 'postgresql'
+
+
+# --- writing
+
+
+def csv_value(value):
+    # the same text COPY ... WITH (FORMAT csv) produces
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def json_value(value):
+    return value.isoformat()
+
+
+def export(model, format, output, batch_size, progress=None):
+    fields = FIELDS[model]
+    rows = queryset(model)
+
+    if use_copy(format):
+        output.write(','.join(fields) + '\n')
+        sql, params = rows.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.copy_expert('COPY (%s) TO STDOUT WITH (FORMAT csv)' % cursor.mogrify(sql, params).decode(), output)
+            return cursor.rowcount
+
+    if format == 'csv':
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(fields)
+        write = lambda row: writer.writerow([csv_value(value) for value in row])
+    else:
+        write = lambda row: output.write(json.dumps(dict(zip(fields, row)), default=json_value,
+                                                    ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    count = 0
+    for row in rows.iterator(chunk_size=batch_size):
+        write(row)
+        count += 1
+        if progress is not None and count % batch_size == 0:
+            progress(count)
+    return count
+
+
+# --- reading
+
+
+def read_rows(format, input):
+    if format == 'csv':
+        return csv.DictReader(input)
+    return (json.loads(line) for line in input if line.strip())
+
+
+def batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def text(row, field):
+    # CSV can't tell an empty string from NULL, both import as NULL
+    value = row.get(field)
+    return value if value not in ('', None) else None
+
+
+def boolean(row, field, default=False):
+    value = row.get(field)
+    if value in ('', None):
+        return default
+    if isinstance(value, bool):
+        return value
+    return value.lower() in ('t', 'true', '1', 'yes')
+
+
+def timestamp(row, field):
+    value = text(row, field)
+    return parse_datetime(value) if value else None
+
+
+def is_hashed(password):
+    if password.startswith(UNUSABLE_PASSWORD_PREFIX):
+        return True
+    try:
+        identify_hasher(password)
+    except ValueError:
+        return False
+    return True
+
+
+def _init_worker():
+    # worker processes started with "spawn" begin without Django
+    django.setup()
+
+
+class Importer:
+
+    def __init__(self, model, format, batch_size, workers, use_copy=True, progress=None):
+        self.model = model
+        self.format = format
+        self.batch_size = batch_size
+        self.workers = workers
+        self.use_copy = use_copy
+        self.progress = progress
+        self.pool = None
+
+    # returns the number of rows read
+    def run(self, input):
+        started = timezone.now()
+
+        if self.model == 'projects' and self.use_copy and use_copy(self.format):
+            count = self.copy_projects(input)
+        else:
+            count = 0
+            import_batch = self.import_users if self.model == 'users' else self.import_projects
+            try:
+                for batch in batches(read_rows(self.format, input), self.batch_size):
+                    with transaction.atomic():
+                        import_batch(batch)
+                    count += len(batch)
+                    if self.progress is not None:
+                        self.progress(count)
+            finally:
+                if self.pool is not None:
+                    self.pool.shutdown()
+
+        if self.model == 'projects':
+            # bulk_create and COPY bypass save()
+            update_search_vectors(Project.objects.filter(updated_at__gte=started))
+        return count
+
+    # plain text passwords are hashed in worker processes, hashes
+    # exported from another database are kept as they are
+    def hash_passwords(self, passwords):
+        plain = [password for password in passwords if password and not is_hashed(password)]
+        if not plain:
+            hashed = {}
+        elif self.workers > 1:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+            hashed = dict(zip(plain, self.pool.map(make_password, plain, chunksize=16)))
+        else:
+            hashed = {password: make_password(password) for password in plain}
+
+        return [hashed.get(password, password) if password else make_password(None) for password in passwords]
+
+    def import_users(self, rows):
+        now = timezone.now()
+        passwords = self.hash_passwords([text(row, 'password') for row in rows])
+
+        User.objects.bulk_create([
+            User(username=row['username'],
+                 first_name=text(row, 'first_name') or '',
+                 last_name=text(row, 'last_name') or '',
+                 email=text(row, 'email') or '',
+                 password=password,
+                 is_active=boolean(row, 'is_active', True),
+                 is_staff=boolean(row, 'is_staff'),
+                 is_superuser=boolean(row, 'is_superuser'),
+                 date_joined=timestamp(row, 'date_joined') or now)
+            for row, password in zip(rows, passwords)
+        ], ignore_conflicts=True)
+
+        # ids aren't returned for ignore_conflicts inserts
+        user_ids = dict(User.objects.filter(username__in=[row['username'] for row in rows])
+                        .values_list('username', 'id'))
+        Person.objects.bulk_create([
+            Person(user_id=user_ids[row['username']], job_title=text(row, 'job_title'))
+            for row in rows
+        ], ignore_conflicts=True)
+
+        keys = [readcache.user_id_key(username) for username in user_ids]
+        transaction.on_commit(lambda: readcache.invalidate(*keys))
+
+    def import_projects(self, rows):
+        usernames = {row['username'] for row in rows if text(row, 'username')}
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        titles = [row['title'] for row in rows]
+        existing = set(Project.objects.filter(title__in=titles).values_list('title', flat=True))
+
+        # auto_now_add stamps date_created with the import time
+        Project.objects.bulk_create([
+            Project(title=row['title'],
+                    user_id=user_ids.get(text(row, 'username')),
+                    long_description=text(row, 'long_description'),
+                    short_description=text(row, 'short_description'),
+                    contributions=text(row, 'contributions'),
+                    thumbnail=text(row, 'thumbnail'))
+            for row in rows
+        ], ignore_conflicts=True)
+
+        # the projects inserted now (titles taken already were skipped)
+        # get the creation times from the file
+        created = {}
+        for row in rows:
+            if row['title'] not in existing:
+                created.setdefault(row['title'], timestamp(row, 'date_created'))
+        projects = list(Project.objects.filter(title__in=created).only('id', 'title', 'user_id'))
+        dated = []
+        for project in projects:
+            if created[project.title] is not None:
+                project.date_created = created[project.title]
+                dated.append(project)
+        Project.objects.bulk_update(dated, ['date_created'], batch_size=self.batch_size)
+
+        transaction.on_commit(lambda: readcache.forget_projects(projects))
+
+    # Postgres: COPY into a temporary table, then one INSERT ... SELECT
+    # resolving usernames; titles that exist already are skipped
+    def copy_projects(self, input):
+        header = next(csv.reader([input.readline()]))
+        unknown = set(header) - set(PROJECT_FIELDS)
+        if unknown or 'title' not in header:
+            raise ValueError("unexpected CSV columns: " + ", ".join(sorted(unknown or {'title'})))
+
+        columns = ', '.join('"%s"' % name for name in header)
+        select = {
+            'title': 'i.title',
+            'user_id': 'u.id' if 'username' in header else 'NULL',
+            'long_description': "NULLIF(i.long_description, '')",
+            'short_description': "NULLIF(i.short_description, '')",
+            'contributions': "NULLIF(i.contributions, '')",
+            'thumbnail': "NULLIF(i.thumbnail, '')",
+            'date_created': 'COALESCE(i.date_created, now())',
+            'updated_at': 'now()',
+        }
+        for name in ('long_description', 'short_description', 'contributions', 'thumbnail', 'date_created'):
+            if name not in header:
+                select[name] = 'now()' if name == 'date_created' else 'NULL'
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE project_import (title text, username text, long_description text, '
+                'short_description text, contributions text, thumbnail text, date_created timestamptz) '
+                'ON COMMIT DROP')
+            cursor.copy_expert('COPY project_import (%s) FROM STDIN WITH (FORMAT csv)' % columns, input)
+            count = cursor.rowcount
+            cursor.execute(
+                'INSERT INTO projectmanager_project (%s) SELECT %s FROM project_import i '
+                'LEFT JOIN auth_user u ON u.username = %s ON CONFLICT (title) DO NOTHING '
+                'RETURNING title, user_id' % (
+                    ', '.join(select), ', '.join(select.values()),
+                    'i.username' if 'username' in header else 'NULL'))
+            projects = [Project(title=title, user_id=user_id) for title, user_id in cursor.fetchall()]
+            transaction.on_commit(lambda: readcache.forget_projects(projects))
+
+        return count
+
+
+def rate(count, seconds):
+    return count / seconds if seconds > 0 else float(count)
+
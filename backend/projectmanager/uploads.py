@@ -0,0 +1,24 @@
+import hashlib
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+# Streams every uploaded file to a temporary file while it arrives and
+# hashes it on the way, so no upload is held in memory and
+# storage.HashedMediaStorage can move it into place under its content
+# hash without reading it again. Installed through FILE_UPLOAD_HANDLERS;
+# temporary files go to FILE_UPLOAD_TEMP_DIR, which should be on the
+# same filesystem as MEDIA_ROOT for the move to be a rename.
+class HashingUploadHandler(TemporaryFileUploadHandler):
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.digest.hexdigest()
+        return file
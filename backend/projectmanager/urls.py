@@ -1,13 +1,19 @@
+from django.conf import settings
 from django.urls import path, re_path
 from .views import CustomAuthToken, ProjectViewSet, UserViewSet
+from . import async_views
 
 urlpatterns = [
     path('delete_all_projects/', ProjectViewSet.as_view({'delete':'delete_all_projects'})),
     path('flush_database/', ProjectViewSet.as_view({'delete':'flush_database'})),
     path('projects/', ProjectViewSet.as_view({'get':'projects'})),
+    path('search/', ProjectViewSet.as_view({'get':'search'})),
+    path('changes/', ProjectViewSet.as_view({'get':'changes'})),
     path('create/', ProjectViewSet.as_view({'post':'create'})),
     path('update/', ProjectViewSet.as_view({'post':'update'})),
     path('delete_project/', ProjectViewSet.as_view({'post':'delete_project'})),
+    # passes the action's parser_classes, as_view() doesn't pick them up itself
+    path('batch/', ProjectViewSet.as_view({'post':'batch'}, **ProjectViewSet.batch.kwargs)),
     re_path(r'^view_project/(?:title-(?P<title>\w+)/)?$', ProjectViewSet.as_view({'get':'view_project'})),
     re_path(r'^get_thumbnail/(?:title-(?P<title>\w+)/)?$', ProjectViewSet.as_view({'get':'get_thumbnail'})),
     path('log_in/', CustomAuthToken.as_view()),
@@ -15,4 +21,16 @@ urlpatterns = [
     path('users/', UserViewSet.as_view({'get':'users'})),
     re_path(r'^profile/(?:username-(?P<username>\w+)/)?$', UserViewSet.as_view({'get':'profile'})),
     path('create_account/', UserViewSet.as_view({'post':'create_account'})),
+    path('cache_stats/', ProjectViewSet.as_view({'get':'cache_stats'})),
 ]
+
+# serve the read endpoints with the native async views instead
+# (for the ASGI deployment, see async_views.py)
+if settings.ASYNC_READ_VIEWS:
+    async_urlpatterns = [
+        path('projects/', async_views.projects),
+        re_path(r'^view_project/(?:title-(?P<title>\w+)/)?$', async_views.view_project),
+        re_path(r'^get_thumbnail/(?:title-(?P<title>\w+)/)?$', async_views.get_thumbnail),
+        re_path(r'^profile/(?:username-(?P<username>\w+)/)?$', async_views.profile),
+    ]
+    urlpatterns = async_urlpatterns + urlpatterns
@@ -6,32 +6,117 @@ from rest_framework.decorators import action, permission_classes
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, AllowAny
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
+from rest_framework.parsers import JSONParser
+from rest_framework.fields import DateTimeField
 
 from .serializers import ProjectSerializer, UserSerializer
 from .models import Project, Person
+from .credentials import authenticate_request, forget_credentials
+from .tasks import release_thumbnails, submit, sweep_thumbnails
+from .thumbnails import best_rendition, generate_renditions
+from .search import search_projects
+from .authentication import is_expired, remember_token
+from .batch import run_batch
+from .changes import UPDATED, CursorExpired, delete_projects, get_changes
+from .parsers import BatchNDJSONParser
+from . import authentication, hashing, readcache
+from .bulk import delete_users
+from .conditional import add_validators, aggregate_validators, conditional_response, row_validators
+from .projectors import project_projector, user_projector
+from .throttling import AdmissionControlMixin, BucketThrottle
 from django.contrib.auth.models import User
-from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
-
-from django.http import HttpResponseRedirect
+from django.db import IntegrityError, transaction
+
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.conf import settings
+
+from rest_framework.utils.urls import replace_query_param
+from .pagination import KeysetPaginator
+from .renderers import dumps
+from .metrics import timed
+
+project_paginator = KeysetPaginator(ordering=('date_created', 'id'))
+changes_paginator = KeysetPaginator(ordering=('updated_at', 'id'), cursor_param='since')
+user_paginator = KeysetPaginator(ordering=('id',))
+
+PROFILE_PARAMETERS = {'username', 'limit', 'cursor'}
+
+# parses the optional `fields=a,b,c` query parameter
+def requested_fields(request, allowed):
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(allowed)
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise ValueError("unknown field(s): " + ", ".join(sorted(unknown)))
+
+    return fields
+
+# streams projects one JSON document per line; rows are read from the
+# database in chunks so memory use does not grow with the table size
+def stream_projects(projects, fields):
+    projector = project_projector.only(fields)
+    rows, _ = projector.values(projects)
+
+    def lines():
+        for row in rows.iterator(chunk_size=2000):
+            yield dumps(projector.project(row)) + b'\n'
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+# a page of projects/ as (data, next_cursor); raises ValueError for a
+# bad limit or cursor
+def project_page(request, fields):
+    projector = project_projector.only(fields)
+    # the ordering key is always selected for the cursor
+    projects, get = projector.values(Project.objects.all(), project_paginator.ordering)
+    rows, next_cursor = project_paginator.paginate(
+        projects, request, key=lambda row: [get(row, name) for name in project_paginator.ordering])
+    with timed('serialize'):
+        data = projector.project_all(rows)
+    return data, next_cursor
 
 # This class allows us to add more fields in the response
 # when a user logs in. By default, only the token is returned
-class CustomAuthToken(ObtainAuthToken):
+class CustomAuthToken(AdmissionControlMixin, ObtainAuthToken):
+
+    # ObtainAuthToken turns throttling off
+    throttle_classes = [BucketThrottle]
+    throttle_scope = 'auth'
 
     # This function allows us to include first_name, job_title
     # in the Response when a user logs into their account
     def post(self, request):
-        serializer = self.serializer_class(data=request.data)
+        try:
+            username = request.data['username']
+            password = request.data['password']
+        except:
+            return Response({"status":"bad request"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if serializer.is_valid():
-            user = serializer.validated_data['user']
-            token, created = Token.objects.get_or_create(user=user)
+        # the password check runs on the hashing pool, a 429 when it's busy
+        with timed('auth'):
+            user = hashing.authenticate(username, password)
+
+        if user is not None:
+
+            # the token and the user's Person row in one query; an
+            # expired token is replaced by a new one (see TOKEN_TTL)
+            token = Token.objects.select_related('user', 'user__person').filter(user=user).first()
+            if token is None or is_expired(token):
+                if token is not None:
+                    token.delete()
+                token, created = Token.objects.get_or_create(user=user)
+
+            # the client is about to use it
+            remember_token(token)
 
             display = {
                 'token': token.key,
                 'first_name': user.first_name,
-                'job_title': user.person.job_title
+                'job_title': token.user.person.job_title
             }
 
             return Response(display, status=status.HTTP_200_OK)
@@ -39,39 +124,30 @@ class CustomAuthToken(ObtainAuthToken):
         return Response({"status":"bad request"}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(AdmissionControlMixin, ModelViewSet):
     serializer_class = UserSerializer
     queryset = User.objects.all()
 
-    # display all users (only useful for testing)
+    # display all users (only useful for testing), a page at a time
+    # optional parameters: limit=<n>, cursor=<cursor> (see projects/)
     @action(detail=False, methods=['get'])
     def users(self, request):
-        users = User.objects.all()
+        # one LEFT JOIN query, superusers are filtered out by the database
+        users, get = user_projector.values(User.objects.filter(is_superuser=False))
 
-        display = []
-
-        for user in users:
-
-            if user.is_superuser:
-                continue
-
-            job_title = user.person.job_title
-
-            user_info = {
-                "id": user.id,
-                "first_name": user.first_name,
-                "job_title": job_title,
-                "username": user.username,
-                "email": user.email,
-            }
-
-            display.append(user_info)
+        try:
+            users, next_cursor = user_paginator.paginate(users, request, key=lambda row: [get(row, 'id')])
+        except ValueError as e:
+            return Response({"error":str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(display, status=status.HTTP_200_OK)
+        response = Response(user_projector.project_all(users), status=status.HTTP_200_OK)
+        return user_paginator.add_headers(response, request, next_cursor)
 
     @action(detail=False, methods=['delete'], permission_classes=[IsAuthenticated])
     def log_out(self, request):
-        request.user.auth_token.delete()
+        # the post_delete signal drops it from the token cache
+        request.auth.delete()
+        forget_credentials(request.user)
         return Response({"status":"sucessfully logged out"}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'])
@@ -103,7 +179,8 @@ class UserViewSet(ModelViewSet):
                 email = serializer.validated_data['email']
                 password = serializer.validated_data['password']
 
-                user = User.objects.create_user(
+                # hashes on the bounded pool, a 429 when it's busy
+                user = hashing.create_user(
                         first_name=first_name,
                         username=username,
                         email=email,
@@ -121,43 +198,39 @@ class UserViewSet(ModelViewSet):
 
         return Response({"status":"bad request"}, status=status.HTTP_400_BAD_REQUEST)
 
-    # display all projects by a specific user (username: <username>)
+    # display a user's projects, oldest first, one page at a time
+    # parameters: username=<username>
+    # optional parameters: limit=<n>, cursor=<cursor> (see projects/)
     @action(detail=False, methods=['get'])
     def profile(self, request):
         parameters = request.GET
-        num_parameters = len(request.GET)
 
-        if num_parameters != 1:
+        if 'username' not in parameters or not set(parameters) <= PROFILE_PARAMETERS:
             return Response({"status":"incorrect number of arguments"}, status=status.HTTP_400_BAD_REQUEST)
         else:
             try:
                 username = parameters['username']
-                user = get_object_or_404(User, username=username)
-                projects = Project.objects.filter(user=user)
-
-                display = []
-
-                for project in projects:
-                    project_info = {
-                        "id": project.id,
-                        "thumbnail": "/media/" + str(project.thumbnail),
-                        "title": project.title,
-                        "short_description": project.short_description
-                    }
-
-                    display.append(project_info)
-
-                return Response(display, status=status.HTTP_200_OK)
+                display, next_cursor, validators = readcache.get_profile(username, request)
+            except ValueError as e:
+                return Response({"error":str(e)}, status=status.HTTP_400_BAD_REQUEST)
             except:
                 return Response({"status":"bad request"}, status=status.HTTP_400_BAD_REQUEST)
 
+            not_modified = conditional_response(request, validators)
+            if not_modified is not None:
+                return not_modified
+
+            response = Response(display, status=status.HTTP_200_OK)
+            add_validators(response, validators)
+            return readcache.profile_paginator.add_headers(response, request, next_cursor)
+
 
 # unathenticated users may only perform GET requests
 # other request types only be allowed if authenticated
 
 #@permission_classes([IsAuthenticatedOrReadOnly])
 @permission_classes([AllowAny]) # auth thru request body
-class ProjectViewSet(ModelViewSet):
+class ProjectViewSet(AdmissionControlMixin, ModelViewSet):
 
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
@@ -165,12 +238,10 @@ class ProjectViewSet(ModelViewSet):
     @action(detail=False, methods=['delete'])
     def delete_all_projects(self, request):
 
-        # Authentication verification thru request body rather than tokens
+        # Authentication verification thru request body (or an auth token)
         #-----------------------------------------------------------------
         try:
-            username = request.data['username']
-            password = request.data['password']
-            user = authenticate(username=username, password=password)
+            user = authenticate_request(request)
             if user == None:
                 return Response({"error":"incorrect authentication"}, status=status.HTTP_400_BAD_REQUEST)
             elif user.is_superuser == False:
@@ -178,22 +249,23 @@ class ProjectViewSet(ModelViewSet):
         except:
             return Response({"status":"username or password is missing"}, status=status.HTTP_400_BAD_REQUEST)
         #-----------------------------------------------------------------
-        projects = Project.objects.all()
 
-        for project in projects:
-            project.delete()
+        # set-based delete in one transaction; orphaned thumbnail
+        # files are cleaned up in the background afterwards
+        with transaction.atomic():
+            deleted = delete_projects(Project.objects.all(), everything=True)
+
+        submit(sweep_thumbnails)
 
-        return Response({"status":"all projects deleted"}, status=status.HTTP_200_OK)
+        return Response({"status":"all projects deleted", "deleted":{"projects":deleted}}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['delete'])
     def flush_database(self, request):
 
-        # Authentication verification thru request body rather than tokens
+        # Authentication verification thru request body (or an auth token)
         #-----------------------------------------------------------------
         try:
-            username = request.data['username']
-            password = request.data['password']
-            user = authenticate(username=username, password=password)
+            user = authenticate_request(request)
             if user == None:
                 return Response({"error":"incorrect authentication"}, status=status.HTTP_400_BAD_REQUEST)
             elif user.is_superuser == False:
@@ -202,25 +274,185 @@ class ProjectViewSet(ModelViewSet):
             return Response({"status":"username or password is missing"}, status=status.HTTP_400_BAD_REQUEST)
         #-----------------------------------------------------------------
 
-        users = User.objects.all()
-        projects = Project.objects.all()
+        # set-based deletes in one transaction, with their Person rows
+        # and auth tokens; no signals are sent, the token cache is
+        # dropped as a whole
+        with transaction.atomic():
+            projects = delete_projects(Project.objects.all(), everything=True)
+            users, persons = delete_users(User.objects.filter(is_superuser=False))
+            transaction.on_commit(authentication.forget_all)
 
-        for project in projects:
-            project.delete()
+        submit(sweep_thumbnails)
 
-        for user in users:
-            if user.is_superuser == False:
-                user.delete()
+        deleted = {
+            "projects": projects,
+            "users": users,
+            "persons": persons,
+        }
 
-        return Response({"status":"successfully flushed database"}, status=status.HTTP_200_OK)
+        return Response({"status":"successfully flushed database", "deleted":deleted}, status=status.HTTP_200_OK)
 
-    # display all projects in database (for testing)
+    # hit/miss counters of the read cache in this worker process
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        return Response(readcache.get_stats(), status=status.HTTP_200_OK)
+
+    # create, update and delete many projects in one request
+    # body: {"username": ..., "password": ..., "operations": [
+    #           {"op": "create", "title": ..., "long_description": ..., ...},
+    #           {"op": "update", "title": ..., "contributions": ...},
+    #           {"op": "delete", "title": ...}]}
+    # with a Token header the body may also be just the JSON array of
+    # operations, or one operation per line (Content-Type: application/x-ndjson)
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, BatchNDJSONParser])
+    def batch(self, request):
+
+        # Authentication verification thru request body (or an auth token)
+        #-----------------------------------------------------------------
+        try:
+            user = authenticate_request(request)
+            if user == None:
+                return Response({"error":"incorrect authentication"}, status=status.HTTP_400_BAD_REQUEST)
+        except:
+            return Response({"status":"username or password is missing"}, status=status.HTTP_400_BAD_REQUEST)
+        #-----------------------------------------------------------------
+
+        if isinstance(request.data, list):
+            operations = request.data
+        else:
+            operations = request.data.get('operations')
+
+        if not isinstance(operations, list):
+            return Response({"error":"operations must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(operations) > settings.BATCH_MAX_OPERATIONS:
+            return Response({"error":"at most %d operations per batch" % settings.BATCH_MAX_OPERATIONS}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = run_batch(user, operations)
+        except IntegrityError:
+            return Response({"error":"a project title was taken concurrently, nothing was applied"}, status=status.HTTP_409_CONFLICT)
+
+        return Response({"results":results}, status=status.HTTP_200_OK)
+
+    # display projects in database, oldest first, one page at a time
+    # optional parameters:
+    #   fields=id,title,...  only load and return these fields
+    #   limit=<n>            page size (default 50, max 500)
+    #   cursor=<cursor>      next page, taken from the Link header
+    #   stream=ndjson        stream every project as newline delimited JSON
     @action(detail=False, methods=['get'])
     def projects(self, request):
-        projects = Project.objects.all()
+        try:
+            fields = requested_fields(request, ProjectSerializer.Meta.fields)
+        except ValueError as e:
+            return Response({"error":str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # a client that already has this page gets a 304 after a
+        # single aggregate query
+        validators = aggregate_validators(Project.objects.all(), request.GET.urlencode())
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        if request.GET.get('stream') == 'ndjson':
+            response = stream_projects(project_paginator.order(Project.objects.all()), fields)
+            return add_validators(response, validators)
+
+        try:
+            data, next_cursor = project_page(request, fields)
+        except ValueError as e:
+            return Response({"error":str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response(data, status=status.HTTP_200_OK)
+        add_validators(response, validators)
+        return project_paginator.add_headers(response, request, next_cursor)
+
+    # projects created, updated or deleted since the cursor, oldest first
+    # optional parameters:
+    #   since=<cursor>       taken from the X-Next-Cursor header of the
+    #                        previous call, without it the feed starts at
+    #                        the beginning
+    #   limit=<n>, fields=   as for projects/
+    # a 410 means the cursor is older than the deletes kept around
+    # (CHANGES_RETENTION_DAYS), the client has to start over
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        try:
+            fields = requested_fields(request, ProjectSerializer.Meta.fields)
+            limit = changes_paginator.get_limit(request)
+            projects = Project.objects.only(*fields, 'title', 'updated_at')
+            changes, next_cursor, more = get_changes(projects, request.GET.get('since'), limit)
+        except ValueError as e:
+            return Response({"error":str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except CursorExpired:
+            return Response({"error":"cursor expired, sync from the beginning"}, status=status.HTTP_410_GONE)
+
+        updated = [project for kind, project in changes if kind == UPDATED]
+        serializer = ProjectSerializer(updated, many=True, fields=fields)
+        with timed('serialize'):
+            data = iter(serializer.data)
+
+        timestamp = DateTimeField()
+        display = []
+
+        for kind, change in changes:
+            if kind == UPDATED:
+                change_info = {
+                    "change": "updated",
+                    "id": change.id,
+                    "title": change.title,
+                    "changed_at": timestamp.to_representation(change.updated_at),
+                    "project": next(data),
+                }
+            else:
+                change_info = {
+                    "change": "deleted",
+                    "id": change.project_id,
+                    "title": change.title,
+                    "changed_at": timestamp.to_representation(change.deleted_at),
+                    "project": None,
+                }
+
+            display.append(change_info)
+
+        response = Response(display, status=status.HTTP_200_OK)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        if more:
+            response['Link'] = changes_paginator.next_link(request, next_cursor)
+        return response
+
+    # ranked full-text search over title, descriptions and contributions
+    # parameters: q=<words>, optional page=<n>, limit=<n>, fields=...
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        text = request.GET.get('q', '').strip()
+        if not text:
+            return Response({"error":"q parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            fields = requested_fields(request, ProjectSerializer.Meta.fields)
+            limit = project_paginator.get_limit(request)
+            page = int(request.GET.get('page', 1))
+            if page < 1:
+                raise ValueError
+        except ValueError as e:
+            return Response({"error":str(e) or "page must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = ProjectSerializer(projects, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # one extra row tells whether there is a next page
+        projects = search_projects(text, (page - 1) * limit, limit + 1)
+
+        serializer = ProjectSerializer(projects[:limit], many=True, fields=fields)
+        with timed('serialize'):
+            data = serializer.data
+        response = Response(data, status=status.HTTP_200_OK)
+
+        if len(projects) > limit:
+            next_page = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
+            response['Link'] = '<%s>; rel="next"' % next_page
+
+        return response
 
 # Example Request:
 # http://127.0.0.1:8000/projectmanager/params/?title=Abby's First Project
@@ -234,12 +466,19 @@ class ProjectViewSet(ModelViewSet):
         else:
             try:
                 title = parameters['title']
-                project = get_object_or_404(Project, title=title)
+                project = readcache.get_project(title)
+
+                validators = row_validators(project['id'], project['updated_at'])
+                not_modified = conditional_response(request, validators)
+                if not_modified is not None:
+                    return not_modified
+
                 display = {
-                    "long_description": project.long_description,
-                    "contributions": project.contributions
+                    "long_description": project['long_description'],
+                    "contributions": project['contributions']
                 }
-                return Response(display, status=status.HTTP_200_OK)
+                response = Response(display, status=status.HTTP_200_OK)
+                return add_validators(response, validators)
             except:
                 return Response({"status":"bad request"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -248,12 +487,10 @@ class ProjectViewSet(ModelViewSet):
     def create(self, request):
         serializer = ProjectSerializer(data=request.data)
         if serializer.is_valid():
-# Authentication verification thru request body rather than tokens
+# Authentication verification thru request body (or an auth token)
 #-----------------------------------------------------------------
             try:
-                username = request.data['username']
-                password = request.data['password']
-                user = authenticate(username=username, password=password)
+                user = authenticate_request(request)
                 if user == None:
                     return Response({"error":"incorrect authentication"}, status=status.HTTP_400_BAD_REQUEST)
             except:
@@ -264,21 +501,12 @@ class ProjectViewSet(ModelViewSet):
             project = Project()
             project.user = user
 
-            if serializer.initial_data.get('title'):
-                title_data = serializer.validated_data['title']
-
-                # check if project with that title alreadu exists
-                already_exists = Project.objects.filter(title=title_data)
-
-                if already_exists:
-                    return Response({"error":"project with that title already exists"}, status=status.HTTP_409_CONFLICT)
-
             # confirm that the request has the following fields
             req_title = serializer.validated_data.get('title')
             req_contributions = serializer.validated_data.get('contributions')
             req_long_desc = serializer.validated_data.get('long_description')
             req_short_desc = serializer.validated_data.get('short_description')
-        #    req_thumbnail = serializer.validated_data.get('thumbnail')
+            req_thumbnail = serializer.validated_data.get('thumbnail')
 
             # if the request had all four fields filled out, create
             # the new project using the data from the request
@@ -287,9 +515,20 @@ class ProjectViewSet(ModelViewSet):
                 project.contributions = serializer.validated_data['contributions']
                 project.long_description = serializer.validated_data['long_description']
                 project.short_description = serializer.validated_data['short_description']
-                project.thumbnail = 'placeholder' #serializer.validated_data['thumbnail']
+                project.thumbnail = req_thumbnail if req_thumbnail else 'placeholder'
+
+                # titles are unique in the database, a duplicate
+                # fails on insert instead of needing a lookup first
+                try:
+                    with transaction.atomic():
+                        project.save()
+                except IntegrityError:
+                    return Response({"error":"project with that title already exists"}, status=status.HTTP_409_CONFLICT)
+
+                # resized versions are made in the background
+                if req_thumbnail:
+                    submit(generate_renditions, project.thumbnail.name)
 
-                project.save()
                 return Response({"status":"successfully created project"}, status=status.HTTP_201_CREATED)
             else:
                 return Response({"error":"required field(s) missing"}, status=status.HTTP_400_BAD_REQUEST)
@@ -303,12 +542,10 @@ class ProjectViewSet(ModelViewSet):
 
         if serializer.is_valid():
 
-    # Authentication verification thru request body rather than tokens
+    # Authentication verification thru request body (or an auth token)
     #-----------------------------------------------------------------
             try:
-                username = request.data['username']
-                password = request.data['password']
-                user = authenticate(username=username, password=password)
+                user = authenticate_request(request)
                 if user == None:
                     return Response({"error":"incorrect authentication"}, status=status.HTTP_400_BAD_REQUEST)
             except:
@@ -335,10 +572,20 @@ class ProjectViewSet(ModelViewSet):
                 if serializer.data.get('short_description'):
                     project.short_description = serializer.validated_data['short_description']
 
+                replaced = None
                 if serializer.validated_data.get('thumbnail'):
+                    replaced = project.thumbnail.name
                     project.thumbnail = serializer.validated_data['thumbnail']
 
                 project.save()
+
+                # resized versions are made in the background, the old
+                # thumbnail goes unless another project uses it too
+                if serializer.validated_data.get('thumbnail'):
+                    submit(generate_renditions, project.thumbnail.name)
+                    if replaced != project.thumbnail.name:
+                        submit(release_thumbnails, [replaced])
+
                 return Response({"status":"sucessfully updated project"}, status=status.HTTP_202_ACCEPTED)
             else:
                 return Response({"error":"you don't have permission"}, status=status.HTTP_401_UNAUTHORIZED)
@@ -353,12 +600,10 @@ class ProjectViewSet(ModelViewSet):
         serializer = ProjectSerializer(data=request.data)
         if serializer.is_valid():
 
-    # Authentication verification thru request body rather than tokens
+    # Authentication verification thru request body (or an auth token)
     #-----------------------------------------------------------------
             try:
-                username = request.data['username']
-                password = request.data['password']
-                user = authenticate(username=username, password=password)
+                user = authenticate_request(request)
                 if user == None:
                     return Response({"error":"incorrect authentication"}, status=status.HTTP_400_BAD_REQUEST)
             except:
@@ -371,7 +616,8 @@ class ProjectViewSet(ModelViewSet):
 
                 # for Token auth
             #    if request.user == project.user:
-                project.delete()
+                with transaction.atomic():
+                    delete_projects(Project.objects.filter(pk=project.pk))
                 return Response({"status":"project successfully deleted"}, status=status.HTTP_200_OK)
             #    else:
             #        return Response({"error":"you don't have permission to delete this project"}, status=status.HTTP_401_UNAUTHORIZED)
@@ -383,17 +629,28 @@ class ProjectViewSet(ModelViewSet):
 
 # returns a link to the path
     @action(detail=False, methods=['get'])
+    # with the optional size=<px> parameter the URL of the rendition
+    # best fitting that size is returned (the original until the
+    # renditions have been generated)
     def get_thumbnail(self, request):
         parameters = request.GET
         num_parameters = len(request.GET)
 
+        if 'size' in parameters:
+            num_parameters -= 1
+
         if num_parameters != 1:
             return Response({"status":"incorrect number of arguments"}, status=status.HTTP_400_BAD_REQUEST)
         else:
             try:
                 title = parameters['title']
-                project = get_object_or_404(Project, title=title)
-                img = "/media/" + str(project.thumbnail)
+                project = readcache.get_project(title)
+                thumbnail = project['thumbnail'] or ''
+
+                if 'size' in parameters and thumbnail:
+                    thumbnail = best_rendition(thumbnail, int(parameters['size'])) or thumbnail
+
+                img = "/media/" + thumbnail
                 return Response({"thumbnail":img}, status=status.HTTP_200_OK)
         #        return HttpResponseRedirect(img)
             except: